@@ -0,0 +1,484 @@
+import math
+import warnings
+
+import numpy as np
+import scipy.stats as st
+
+from paths import SOBOL_REPLICATES
+from results import TRIAL_DTYPE, avg_price_ratios, buy_count_ratios, net_worth_ratios
+
+
+# Per-trial metrics the driver tables report on
+METRICS = (
+    "ratio",
+    "winning_ratio",
+    "losing_ratio",
+    "price",
+    "avg_price_ratio",
+    "buy_count_ratio",
+)
+
+
+def trial_metrics(records, starting_price):
+    ratios = net_worth_ratios(records)
+    prices = records["reg"]["last_price"]
+    return {
+        "ratio": ratios,
+        "winning_ratio": ratios[prices >= starting_price],
+        "losing_ratio": ratios[prices < starting_price],
+        "price": prices,
+        "avg_price_ratio": avg_price_ratios(records),
+        "buy_count_ratio": buy_count_ratios(records),
+    }
+
+
+def percentile_index(count, percent):
+    return min(count * percent // 100, count - 1)
+
+
+class RunningStats:
+    # Mergeable count / mean / variance (Chan et al.'s parallel form of
+    # Welford's algorithm). Infinite values are counted separately and make
+    # the mean infinite, the same as np.mean would.
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.inf_count = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        finite = values[np.isfinite(values)]
+        self.inf_count += len(values) - len(finite)
+        if len(finite):
+            self._merge(len(finite), finite.mean(), ((finite - finite.mean()) ** 2).sum())
+
+    def merge(self, other):
+        self.inf_count += other.inf_count
+        if other.count:
+            self._merge(other.count, other.mean, other.m2)
+
+    def _merge(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+
+    def get_mean(self):
+        return math.inf if self.inf_count else self.mean
+
+    def copy(self):
+        return RunningStats.from_dict(self.to_dict())
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": float(self.mean),
+            "m2": float(self.m2),
+            "inf_count": self.inf_count,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.count = data["count"]
+        stats.mean = data["mean"]
+        stats.m2 = data["m2"]
+        stats.inf_count = data["inf_count"]
+        return stats
+
+    def get_variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else math.nan
+
+    def get_sem(self):
+        return math.sqrt(self.get_variance() / self.count) if self.count > 1 else math.nan
+
+    def get_ci(self, confidence=0.95):
+        return st.norm.ppf(confidence) * self.get_sem()
+
+
+class TDigest:
+    # Mergeable quantile sketch. Values are buffered and folded into at most
+    # about `compression` centroids using the k1 scale function, which keeps
+    # centroids small near the tails where P5 / P95 are read. Folding is done
+    # a whole buffer at a time with array operations instead of per value.
+
+    def __init__(self, compression=200, buffer_size=20000):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.buffer = []
+        self.buffered = 0
+        self.inf_count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        finite = values[np.isfinite(values)]
+        self.inf_count += len(values) - len(finite)
+        if not len(finite):
+            return
+        self.min = min(self.min, finite.min())
+        self.max = max(self.max, finite.max())
+        self.buffer.append(finite)
+        self.buffered += len(finite)
+        if self.buffered >= self.buffer_size:
+            self._compress()
+
+    def merge(self, other):
+        other._compress()
+        self.inf_count += other.inf_count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(other.means, other.weights)
+
+    def _compress(self, extra_means=None, extra_weights=None):
+        means = [self.means, *self.buffer]
+        weights = [self.weights, *(np.ones(len(b)) for b in self.buffer)]
+        if extra_means is not None:
+            means.append(extra_means)
+            weights.append(extra_weights)
+        means = np.concatenate(means)
+        weights = np.concatenate(weights)
+        self.buffer = []
+        self.buffered = 0
+        if not len(means):
+            return
+
+        order = np.argsort(means, kind="stable")
+        means = means[order]
+        weights = weights[order]
+
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / cumulative[-1]
+        k = self.compression * (np.arcsin(2 * q - 1) / math.pi + 0.5)
+        groups = np.floor(k).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+
+        group_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / group_weights
+        self.weights = group_weights
+
+    def get_count(self):
+        return self.weights.sum() + self.buffered + self.inf_count
+
+    def get_quantile(self, q):
+        self._compress()
+        finite_count = self.weights.sum()
+        rank = q * (finite_count + self.inf_count)
+        if not finite_count or rank > finite_count:
+            return math.inf if self.inf_count else math.nan
+        centres = np.cumsum(self.weights) - self.weights / 2
+        return float(
+            np.interp(
+                rank,
+                np.r_[0, centres, finite_count],
+                np.r_[self.min, self.means, self.max],
+            )
+        )
+
+    def get_percentile(self, percent):
+        return self.get_quantile(percent / 100)
+
+
+class TurnHistograms:
+    # Per-turn histograms of one value (a price or a net worth) on a fixed
+    # log-spaced grid from `low` to `high`, for its percentiles at every turn
+    # across any number of trials. Blocks of trials are added as
+    # (trials, turns) arrays and histograms on the same grid merge by adding
+    # counts, so memory is turns x bins however many trials go in.
+    #
+    # With a per-turn `scale`, the grid applies to value / scale, which keeps
+    # a value that grows with the turn (e.g. net worth against what has been
+    # paid in) inside a narrow grid. Values outside the grid are counted at
+    # its ends, and percentiles are clipped to each turn's observed min/max,
+    # so a value every trial shares comes back exactly.
+
+    def __init__(self, turns, low, high, bins=512, scale=None):
+        if not 0 < low < high:
+            raise ValueError(f"Histogram range needs 0 < low < high, got {low}, {high}")
+        self.turns = turns
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.scale = None if scale is None else np.asarray(scale, dtype=float)
+        self.log_low = math.log(low)
+        self.step = (math.log(high) - self.log_low) / bins
+        # Bin 0 is below the grid and bin `bins + 1` above it
+        self.counts = np.zeros((turns, bins + 2), dtype=np.int64)
+        self.min = np.full(turns, np.inf)
+        self.max = np.full(turns, -np.inf)
+
+    def add(self, values):
+        np.minimum(self.min, values.min(axis=0), out=self.min)
+        np.maximum(self.max, values.max(axis=0), out=self.max)
+        if self.scale is not None:
+            values = values / self.scale
+        with np.errstate(divide="ignore", invalid="ignore"):
+            positions = (np.log(values) - self.log_low) / self.step
+        positions = np.nan_to_num(positions, nan=-1, posinf=self.bins, neginf=-1)
+        bins = np.clip(np.floor(positions), -1, self.bins).astype(np.int64) + 1
+        bins += np.arange(self.turns) * (self.bins + 2)
+        self.counts += np.bincount(bins.ravel(), minlength=self.counts.size).reshape(
+            self.counts.shape
+        )
+
+    def merge(self, other):
+        same_scale = (self.scale is None and other.scale is None) or (
+            self.scale is not None
+            and other.scale is not None
+            and np.array_equal(self.scale, other.scale)
+        )
+        if not same_scale or (other.turns, other.low, other.high, other.bins) != (
+            self.turns,
+            self.low,
+            self.high,
+            self.bins,
+        ):
+            raise ValueError("Can only merge histograms on the same grid")
+        self.counts += other.counts
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+
+    def get_count(self):
+        return int(self.counts[0].sum())
+
+    def get_percentiles(self, percents):
+        # (len(percents), turns) array, interpolating log-linearly within bins
+        cumulative = self.counts.cumsum(axis=1)
+        turns = np.arange(self.turns)
+        result = np.empty((len(percents), self.turns))
+        for row, percent in enumerate(percents):
+            rank = cumulative[:, -1] * percent / 100
+            index = np.minimum((cumulative < rank[:, None]).sum(axis=1), self.bins + 1)
+            before = np.where(index > 0, cumulative[turns, index - 1], 0)
+            in_bin = self.counts[turns, index]
+            fraction = np.divide(
+                rank - before, in_bin, out=np.zeros(self.turns), where=in_bin > 0
+            )
+            result[row] = np.exp(self.log_low + (index - 1 + fraction) * self.step)
+        result = np.clip(result, self.low, self.high)
+        if self.scale is not None:
+            result *= self.scale
+        return np.clip(result, self.min, self.max)
+
+
+class ExactAggregator:
+    # Keeps every record. Used for the default tables, where exact
+    # percentiles and the exact median seed matter more than memory.
+
+    def __init__(self, starting_price):
+        self.starting_price = starting_price
+        self.chunks = []
+        self._records = None
+        self._metrics = None
+
+    def add(self, records):
+        self.chunks.append(records)
+        self._records = None
+        self._metrics = None
+
+    def get_records(self):
+        if self._records is None:
+            self._records = (
+                np.concatenate(self.chunks) if self.chunks else np.empty(0, TRIAL_DTYPE)
+            )
+            self.chunks = [self._records]
+        return self._records
+
+    def _get_metrics(self):
+        if self._metrics is None:
+            self._metrics = trial_metrics(self.get_records(), self.starting_price)
+        return self._metrics
+
+    def get_count(self):
+        return len(self.get_records())
+
+    def get_mean(self, metric):
+        return np.mean(self._get_metrics()[metric])
+
+    def get_ci(self, metric, confidence=0.95):
+        return st.norm.ppf(confidence) * st.sem(self._get_metrics()[metric])
+
+    def get_median(self, metric):
+        return np.median(self._get_metrics()[metric])
+
+    def get_record_at(self, percent):
+        # The trial sitting at `percent` when trials are ranked by ratio
+        ratios = self._get_metrics()["ratio"]
+        order = np.argsort(ratios, kind="stable")
+        return self.get_records()[order[percentile_index(len(order), percent)]]
+
+
+class StreamingAggregator:
+    # Fixed-memory counterpart of ExactAggregator: running mean / SEM and a
+    # t-digest per metric, plus a reservoir sample of whole records to pick
+    # representative trials (and their seeds) from. Aggregators built on
+    # separate workers or shards can be combined with merge().
+
+    def __init__(self, starting_price, reservoir_size=4096, compression=200, seed=None):
+        self.starting_price = starting_price
+        self.stats = {metric: RunningStats() for metric in METRICS}
+        self.digests = {metric: TDigest(compression) for metric in METRICS}
+        self.reservoir_size = reservoir_size
+        self.reservoir = np.empty(0, TRIAL_DTYPE)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, records):
+        for metric, values in trial_metrics(records, self.starting_price).items():
+            self.stats[metric].add(values)
+            self.digests[metric].add(values)
+        self._sample(records, len(records))
+
+    def merge(self, other):
+        for metric in METRICS:
+            self.stats[metric].merge(other.stats[metric])
+            self.digests[metric].merge(other.digests[metric])
+        self._sample(other.reservoir, other.seen)
+
+    def _sample(self, records, represented):
+        # Weighted reservoir merge: each kept record stands for
+        # seen / len(reservoir) trials, so keep records from the incoming side
+        # in proportion to how many trials it represents.
+        if not len(records):
+            return
+        total = self.seen + represented
+        combined = np.concatenate([self.reservoir, records])
+        if len(combined) > self.reservoir_size:
+            weights = np.r_[
+                np.full(len(self.reservoir), self.seen / max(len(self.reservoir), 1)),
+                np.full(len(records), represented / len(records)),
+            ]
+            keep = self.rng.choice(
+                len(combined), self.reservoir_size, replace=False, p=weights / weights.sum()
+            )
+            combined = combined[np.sort(keep)]
+        self.reservoir = combined
+        self.seen = total
+
+    def get_count(self):
+        return self.seen
+
+    def get_mean(self, metric):
+        return self.stats[metric].get_mean()
+
+    def get_ci(self, metric, confidence=0.95):
+        return self.stats[metric].get_ci(confidence)
+
+    def get_median(self, metric):
+        return self.digests[metric].get_percentile(50)
+
+    def get_record_at(self, percent):
+        # The sampled trial whose ratio is closest to the sketch's percentile
+        target = self.digests["ratio"].get_percentile(percent)
+        ratios = net_worth_ratios(self.reservoir)
+        if math.isinf(target):
+            return self.reservoir[np.argmax(ratios)]
+        return self.reservoir[np.argmin(np.abs(ratios - target))]
+
+
+def sampling_groups(seeds, sampling="random"):
+    # Group number of every trial, such that groups are independent of each
+    # other: antithetic twins share one, as do all trials on one Sobol
+    # scramble; otherwise every trial is its own
+    seeds = np.asarray(seeds, dtype=np.int64)
+    if sampling == "antithetic":
+        keys = np.where(seeds < 0, ~seeds, seeds)
+    elif sampling == "sobol":
+        keys = seeds % SOBOL_REPLICATES
+    else:
+        return np.arange(len(seeds))
+    return np.unique(keys, return_inverse=True)[1]
+
+
+# Below this many independent groups, a variance estimate (and so an
+# effective trial count) is itself rough
+FEW_GROUPS = 30
+
+
+def grouped_mean_variance(values, groups):
+    # Mean of values, the variance of that mean from the spread of the
+    # independent group means, and the number of groups it came from
+    counts = np.bincount(groups)
+    group_means = np.bincount(groups, weights=values) / counts
+    if len(counts) < 2:
+        return values.mean(), math.nan, len(counts)
+    return values.mean(), group_means.var(ddof=1) / len(counts), len(counts)
+
+
+def control_variate_values(values, controls, expectations):
+    # values - β·(controls - expectations), with β the least-squares fit. The
+    # mean is unchanged, and the variance is whatever the controls can't
+    # explain.
+    deviations = controls - expectations
+    centred = deviations - deviations.mean(axis=0)
+    beta = np.linalg.lstsq(centred, values - values.mean(), rcond=None)[0]
+    return values - deviations @ beta
+
+
+def get_estimates(records, sampling="random", controls=None, confidence=0.95):
+    # The mean net worth ratio estimated plainly, with the variance the
+    # sampling method leaves, and with control variates on top if `controls`
+    # are given ({name: (per-trial values, expected value)}). Each comes with
+    # its CI and effective sample size: how many plain random trials would
+    # give the same CI. Effective sizes from fewer than FEW_GROUPS groups
+    # (Sobol's replicates) are marked approximate.
+    #
+    # Trials whose ratio is infinite (the dip buyer ended with nothing) have
+    # no place in a mean, so they are left out and counted in inf_count.
+    ratios = net_worth_ratios(records)
+    finite = np.isfinite(ratios)
+    inf_count = int(np.count_nonzero(~finite))
+    ratios = ratios[finite]
+    records = records[finite]
+    plain_variance = ratios.var(ddof=1)
+
+    def estimate(method, values, groups):
+        mean, variance, group_count = grouped_mean_variance(values, groups)
+        # The variance has group_count - 1 degrees of freedom, which for a few
+        # Sobol replicates makes Student's t noticeably wider than the normal
+        quantile = math.nan
+        if group_count > 1:
+            quantile = st.t.ppf(confidence, group_count - 1)
+        return {
+            "method": method,
+            "mean": float(mean),
+            "ci": float(quantile * math.sqrt(variance)),
+            "trials": len(values),
+            "inf_count": inf_count,
+            "effective_trials": float(plain_variance / variance),
+            "approximate": group_count < FEW_GROUPS,
+        }
+
+    plain_groups = np.arange(len(ratios))
+    estimates = [estimate("plain", ratios, plain_groups)]
+    groups = sampling_groups(records["seed"], sampling)
+    if sampling != "random":
+        estimates.append(estimate(sampling, ratios, groups))
+
+    if controls:
+        # Controls the engine didn't record (NaN) are left out, with a warning
+        # so a smaller reduction isn't taken for the full one
+        recorded = {}
+        for name, (values, expectation) in controls.items():
+            if np.isfinite(values[finite]).all():
+                recorded[name] = (values[finite], expectation)
+            else:
+                warnings.warn(f"Control {name!r} wasn't recorded, leaving it out")
+        controls = recorded
+        if controls:
+            adjusted = control_variate_values(
+                ratios,
+                np.column_stack([values for values, _ in controls.values()]),
+                np.array([expectation for _, expectation in controls.values()]),
+            )
+            method = "control variates"
+            if sampling != "random":
+                method = f"{sampling} + {method}"
+            estimates.append(estimate(method, adjusted, groups))
+    return estimates
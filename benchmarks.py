@@ -0,0 +1,305 @@
+import argparse
+from contextlib import redirect_stdout
+import functools
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+import prettytable
+
+from aggregation import ExactAggregator, StreamingAggregator
+from executors import BACKENDS, Executor
+from historical_data_processor import parse_price_csv, show_summary_data_dir
+from paths import generate_paths
+from results import STRATEGY_FIELDS, records_from_batch
+from simulator import (
+    draw_seeds,
+    run_many_thresholds,
+    run_trial,
+    run_trial_batch,
+    update_price,
+)
+from strategies import (
+    BuyDipThreshold,
+    BuyDipTrend,
+    BuyRegularly,
+    HISTORY_NONE,
+    NeverBuy,
+)
+from vectorized import evaluate_strategies, salary_schedule
+
+
+HIST_PRICES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "hist_prices"
+)
+
+# Everything is seeded, so runs differ only in timing
+ROOT_SEED = 1234
+
+
+def _quiet(fn, *args, **kwargs):
+    with redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def bench_update_price(calls=100000):
+    rng = np.random.default_rng(ROOT_SEED)
+    price = 100
+    for _ in range(calls):
+        price = update_price(rng, price, 0.0006, 0.0094)
+    return calls
+
+
+def bench_run_trial(turns):
+    run_trial(turns, seed=ROOT_SEED, history=HISTORY_NONE)
+    return turns
+
+
+def bench_assess_and_buy(strategy_class, dip_window, turns=20000):
+    kwargs = dict(seed=ROOT_SEED, starting_money=0, print_details=False)
+    if strategy_class is BuyDipThreshold:
+        kwargs.update(threshold=0.95, window=dip_window)
+    elif strategy_class is BuyDipTrend:
+        kwargs.update(trend_length=dip_window)
+    strategy = strategy_class(history=HISTORY_NONE, **kwargs)
+    prices = generate_paths(
+        [ROOT_SEED], turns, growth_midpoint=0.0006, growth_stddev=0.0094
+    )
+    for turn, price in enumerate(prices[0].tolist()):
+        strategy.money += 100
+        strategy.assess_and_buy(price, turn)
+    return turns
+
+
+def bench_run_many_thresholds(num_trials, vectorized, executor):
+    _quiet(
+        run_many_thresholds,
+        num_trials,
+        365 * 3,
+        [0.9, 0.95, 0.99],
+        vectorized=vectorized,
+        root_seed=ROOT_SEED,
+        executor=executor,
+    )
+    return num_trials
+
+
+@functools.lru_cache(maxsize=1)
+def make_records(num_trials, turns=365 * 3):
+    # Built on the warm-up run, so not part of the timed aggregation
+    seeds = draw_seeds(num_trials, root_seed=ROOT_SEED)
+    prices = generate_paths(seeds, turns, growth_midpoint=0.0006, growth_stddev=0.0094)
+    return records_from_batch(
+        evaluate_strategies(prices, salary_schedule(turns), seeds)
+    )
+
+
+def bench_aggregation(records, aggregator_class, chunk_size=1000):
+    aggregator = aggregator_class(100)
+    for start in range(0, len(records), chunk_size):
+        aggregator.add(records[start : start + chunk_size])
+    aggregator.get_mean("ratio")
+    aggregator.get_ci("ratio")
+    aggregator.get_median("price")
+    for percent in (5, 25, 50, 75, 95):
+        aggregator.get_record_at(percent)
+    return len(records)
+
+
+def bench_parse_hist_prices():
+    rows = 0
+    for dir_name in sorted(os.listdir(HIST_PRICES_DIR)):
+        dir_path = os.path.join(HIST_PRICES_DIR, dir_name)
+        if not os.path.isdir(dir_path):
+            continue
+        for filename in sorted(os.listdir(dir_path)):
+            if filename.endswith(".csv"):
+                rows += len(parse_price_csv(os.path.join(dir_path, filename))["date"])
+    return rows
+
+
+def bench_summary_dirs(executor):
+    dirs = 0
+    for dir_name in sorted(os.listdir(HIST_PRICES_DIR)):
+        dir_path = os.path.join(HIST_PRICES_DIR, dir_name)
+        if os.path.isdir(dir_path):
+            _quiet(show_summary_data_dir, dir_path, executor=executor)
+            dirs += 1
+    return dirs
+
+
+def get_benchmarks(executor):
+    # name -> (function returning how many units it processed, unit)
+    benchmarks = {"update_price": (bench_update_price, "call")}
+    for turns in (365, 365 * 3, 365 * 10):
+        benchmarks[f"run_trial[turns={turns}]"] = (
+            lambda turns=turns: bench_run_trial(turns),
+            "turn",
+        )
+    for strategy_class in (BuyRegularly, BuyDipThreshold, BuyDipTrend, NeverBuy):
+        # Only the dip strategies have a window; the others run once
+        windowed = strategy_class in (BuyDipThreshold, BuyDipTrend)
+        for dip_window in (10, 30, 120) if windowed else (30,):
+            name = f"assess_and_buy[{strategy_class.__name__},window={dip_window}]"
+            benchmarks[name] = (
+                lambda c=strategy_class, w=dip_window: bench_assess_and_buy(c, w),
+                "turn",
+            )
+    for num_trials, vectorized in ((50, False), (5000, True)):
+        engine = "vectorized" if vectorized else "per_turn"
+        benchmarks[f"run_many_thresholds[{engine},trials={num_trials}]"] = (
+            lambda n=num_trials, v=vectorized: bench_run_many_thresholds(
+                n, v, executor
+            ),
+            "trial",
+        )
+
+    for aggregator_class in (ExactAggregator, StreamingAggregator):
+        benchmarks[f"aggregation[{aggregator_class.__name__}]"] = (
+            lambda c=aggregator_class: bench_aggregation(make_records(20000), c),
+            "trial",
+        )
+    benchmarks["parse_hist_prices"] = (bench_parse_hist_prices, "row")
+    benchmarks["show_summary_data_dir"] = (lambda: bench_summary_dirs(executor), "dir")
+    return benchmarks
+
+
+# Price models the streamed engine is checked against the whole-array one on
+STREAM_CHECK_MODELS = (
+    {"price_model": "gbm"},
+    {"price_model": "basic"},
+    {"price_model": "bootstrap", "block_length": 10},
+)
+
+
+def check_streaming(turns=1000, num_trials=16, time_blocks=(1, 7, 100, None)):
+    # A streamed run (time_block) times nothing useful unless it gives the
+    # same trials as the whole-array run. Returns the (price model,
+    # time_block) pairs whose records differ; None stands for the whole
+    # horizon as one block.
+    seeds = draw_seeds(num_trials, root_seed=ROOT_SEED)
+    failures = []
+    for path_kwargs in STREAM_CHECK_MODELS:
+        expected = records_from_batch(run_trial_batch(seeds, turns, **path_kwargs)[0])
+        for time_block in time_blocks:
+            streamed = records_from_batch(
+                run_trial_batch(
+                    seeds, turns, time_block=time_block or turns, **path_kwargs
+                )[0]
+            )
+            matches = all(
+                np.allclose(streamed[field][name], expected[field][name], rtol=1e-9)
+                for field in STRATEGY_FIELDS.values()
+                for name in ("net_worth", "avg_price", "buy_count", "last_price")
+            )
+            print(
+                f"{path_kwargs['price_model']}, time_block={time_block or turns}: "
+                f"{'ok' if matches else 'MISMATCH'}"
+            )
+            if not matches:
+                failures.append((path_kwargs["price_model"], time_block))
+    return failures
+
+
+def run_benchmarks(only=None, repeat=3, backend="serial"):
+    results = {}
+    with Executor(backend) as executor:
+        for name, (fn, unit) in get_benchmarks(executor).items():
+            if only and not any(pattern in name for pattern in only):
+                continue
+            fn()  # Warm up caches and imports
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                units = fn()
+                timings.append(time.perf_counter() - start)
+            best = min(timings)
+            results[name] = {
+                "seconds": best,
+                "runs": timings,
+                "units": units,
+                "unit": unit,
+                "per_unit": best / units,
+            }
+            print(f"{name}: {best:.4f}s ({best / units * 1e6:,.2f}µs per {unit})")
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "backend": backend,
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.2):
+    # Names of the benchmarks more than `threshold` slower than the baseline
+    table = prettytable.PrettyTable()
+    table.field_names = ["Benchmark", "Baseline", "Current", "Change"]
+    regressions = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["per_unit"]
+        after = result["per_unit"]
+        change = after / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = " REGRESSION"
+        table.add_row(
+            [
+                name,
+                f"{before * 1e6:,.2f}µs",
+                f"{after * 1e6:,.2f}µs",
+                f"{change:+.1%}{flag}",
+            ]
+        )
+    table.align = "r"
+    table.vrules = prettytable.FRAME
+    print(table)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the simulator's hot paths")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this saved results file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="slowdown per unit, as a fraction, that counts as a regression",
+    )
+    parser.add_argument(
+        "--only", nargs="+", help="only run benchmarks whose names contain these"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", choices=BACKENDS, default="serial")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="first check the streamed engine against the whole-array one",
+    )
+    args = parser.parse_args(argv)
+
+    if args.check and check_streaming():
+        return 1
+    current = run_benchmarks(only=args.only, repeat=args.repeat, backend=args.backend)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(current, baseline, threshold=args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
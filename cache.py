@@ -0,0 +1,101 @@
+from collections import OrderedDict
+import hashlib
+import json
+import os
+
+from aggregation import RunningStats
+
+
+class EvaluationCache:
+    # Remembers the accumulated ratio statistics for each parameter point, so
+    # revisiting a point costs nothing or only the extra trials it still
+    # needs. Each entry also keeps the root seed its trials came from and the
+    # next trial index, so an extended sample only ever adds new trials.
+    # Recently used entries stay in memory; with a `path`, every entry
+    # is also written there as a small JSON file, and the least recently
+    # used files are removed once the directory grows past `max_bytes`.
+
+    def __init__(self, path=None, max_entries=1024, max_bytes=16 * 2**20):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def make_key(params):
+        encoded = json.dumps(params, sort_keys=True, default=repr)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key):
+        # (stats, root_seed, next_trial), or None for a point not seen before
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            stats, root_seed, next_trial = self.memory[key]
+            return stats.copy(), root_seed, next_trial
+
+        if self.path is not None and os.path.exists(self._file(key)):
+            with open(self._file(key)) as f:
+                entry = json.load(f)
+            stats = RunningStats.from_dict(entry["stats"])
+            # Entries written before trial indices were kept have no root, so
+            # they are extended from a fresh one
+            root_seed = entry.get("root_seed")
+            next_trial = entry.get("next_trial", 0)
+            # Touch the file so disk eviction sees it as recently used
+            os.utime(self._file(key))
+            self._remember(key, stats, root_seed, next_trial)
+            self.hits += 1
+            return stats.copy(), root_seed, next_trial
+
+        self.misses += 1
+        return None
+
+    def put(self, key, stats, params=None, root_seed=None, next_trial=0):
+        self._remember(key, stats.copy(), root_seed, next_trial)
+        if self.path is None:
+            return
+
+        tmp_file = f"{self._file(key)}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {
+                    "params": params,
+                    "stats": stats.to_dict(),
+                    "root_seed": root_seed,
+                    "next_trial": next_trial,
+                },
+                f,
+                default=repr,
+            )
+        os.replace(tmp_file, self._file(key))
+        self._evict_files()
+
+    def _remember(self, key, stats, root_seed, next_trial):
+        self.memory[key] = (stats, root_seed, next_trial)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _evict_files(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".json"):
+                info = os.stat(os.path.join(self.path, name))
+                entries.append((info.st_mtime, info.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.path, name))
+            total -= size
+
+    def __repr__(self) -> str:
+        return f"EvaluationCache({self.path}, {self.hits} hits, {self.misses} misses)"
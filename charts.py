@@ -0,0 +1,157 @@
+import math
+
+from matplotlib.figure import Figure
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+DOWNSAMPLE_METHODS = ("minmax", "lttb")
+
+# Far more points than a chart is pixels wide is wasted rendering
+DEFAULT_MAX_POINTS = 2000
+
+
+def minmax_indices(y, max_points):
+    # Indices of the lowest and highest point in each of max_points / 2
+    # buckets, plus the end points, so that every peak and trough survives
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    bucket_size = math.ceil(n / max(max_points // 2, 1))
+    buckets = math.ceil(n / bucket_size)
+    padded = np.full(buckets * bucket_size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, bucket_size)
+    offsets = np.arange(buckets) * bucket_size
+    indices = np.concatenate(
+        [
+            [0, n - 1],
+            offsets + np.nanargmin(padded, axis=1),
+            offsets + np.nanargmax(padded, axis=1),
+        ]
+    )
+    return np.unique(indices)
+
+
+def lttb_indices(y, max_points):
+    # Largest-Triangle-Three-Buckets: keeps the point in each bucket that
+    # makes the largest triangle with the previous pick and the next bucket's
+    # average, which follows the visual shape of the series closely
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = (stop + next_stop - 1) / 2
+        next_y = y[stop:next_stop].mean() if next_stop > stop else y[-1]
+        x = np.arange(start, stop)
+        areas = np.abs(
+            (previous - next_x) * (y[start:stop] - y[previous])
+            - (previous - x) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
+
+
+def downsample(y, max_points=DEFAULT_MAX_POINTS, method="minmax"):
+    # (x, y) of at most about max_points points of y, for plotting
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(
+            f"Unknown downsample method {method!r}, expected one of {DOWNSAMPLE_METHODS}"
+        )
+    y = np.asarray(y, dtype=np.float64)
+    if max_points is None:
+        return np.arange(len(y)), y
+    if method == "lttb":
+        indices = lttb_indices(y, max_points)
+    else:
+        indices = minmax_indices(y, max_points)
+    return indices, y[indices]
+
+
+def plot_trial(
+    ax, prices, buy_thresholds, buy_turns, max_points=DEFAULT_MAX_POINTS, method="minmax"
+):
+    ax.plot(*downsample(prices, max_points, method), label="Price", color="k")
+    ax.plot(
+        *downsample(buy_thresholds, max_points, method), "--r", label="Thresholds"
+    )
+    # One LineCollection for every buy, spanning the axes whatever the y range
+    ax.vlines(
+        buy_turns,
+        0,
+        1,
+        transform=ax.get_xaxis_transform(),
+        linewidth=0.5,
+        color="b",
+    )
+    ax.set_xlabel("Day")
+    ax.set_ylabel("Price")
+
+
+def chart_trial(prices, buy_thresholds, buy_turns, filename=None, **plot_kwargs):
+    # Shows the chart, or with a filename writes it (format from the
+    # extension, e.g. .png or .svg) without needing a display
+    if filename is None:
+        _, ax = plt.subplots()
+        plot_trial(ax, prices, buy_thresholds, buy_turns, **plot_kwargs)
+        plt.show()
+        return
+
+    # A bare Figure keeps off pyplot's global state, so worker threads can
+    # render side by side
+    fig = Figure(figsize=(12, 6))
+    ax = fig.subplots()
+    plot_trial(ax, prices, buy_thresholds, buy_turns, **plot_kwargs)
+    fig.savefig(filename, dpi=150, bbox_inches="tight")
+
+
+def plot_fan(ax, band, percentiles, color, label):
+    # Shades between each pair of percentiles mirrored about the median, the
+    # outermost pair lightest, and draws the median as a line
+    x = np.arange(band.shape[1])
+    middle = len(percentiles) // 2
+    for lower in range(middle):
+        ax.fill_between(
+            x,
+            band[lower],
+            band[-1 - lower],
+            color=color,
+            alpha=0.15 * (lower + 1),
+            linewidth=0,
+            label=f"{label} P{percentiles[lower]}-P{percentiles[-1 - lower]}",
+        )
+    ax.plot(x, band[middle], color=color, label=f"{label} P{percentiles[middle]}")
+
+
+def chart_fan(bands, percentiles, price_name="Price", filename=None):
+    # Price fan on top, each strategy's net worth fan below
+    colors = ("b", "r", "g", "m")
+    if filename is None:
+        fig, (price_ax, worth_ax) = plt.subplots(2, sharex=True)
+    else:
+        fig = Figure(figsize=(12, 9))
+        price_ax, worth_ax = fig.subplots(2, sharex=True)
+
+    plot_fan(price_ax, bands[price_name], percentiles, "k", price_name)
+    price_ax.set_ylabel("Price")
+    price_ax.legend(loc="upper left")
+    strategies = [name for name in bands if name != price_name]
+    for name, color in zip(strategies, colors):
+        plot_fan(worth_ax, bands[name], percentiles, color, name)
+    worth_ax.set_xlabel("Day")
+    worth_ax.set_ylabel("Net Worth")
+    worth_ax.legend(loc="upper left")
+
+    if filename is None:
+        plt.show()
+    else:
+        fig.savefig(filename, dpi=150, bbox_inches="tight")
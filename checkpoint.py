@@ -0,0 +1,114 @@
+import json
+import os
+
+import numpy as np
+
+
+META_FILE = "meta.json"
+STATE_FILE = "state.json"
+
+
+def _normalize(params):
+    # Compare parameters the way they were stored (tuples become lists)
+    return json.loads(json.dumps(params, sort_keys=True, default=repr))
+
+
+def _write_atomic(filename, write):
+    tmp_file = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        write(f)
+    os.replace(tmp_file, filename)
+
+
+class Checkpoint:
+    # A directory holding one run's completed work, so the run can pick up
+    # where it stopped. meta.json records the run's parameters and root seed;
+    # each finished batch of trials is an append-only chunk_<first trial>.npz
+    # with one records array per candidate. A file only appears once it is
+    # complete, so a crash mid-write loses at most the batch in progress.
+    # The chunks are also the run's per-trial output.
+
+    def __init__(self, path, params, root_seed=None, resume=False):
+        self.path = path
+        self.params = _normalize(params)
+        meta_file = os.path.join(path, META_FILE)
+
+        if os.path.exists(meta_file):
+            if not resume:
+                raise ValueError(
+                    f"Checkpoint {path!r} already exists, pass resume=True to continue it"
+                )
+            with open(meta_file) as f:
+                meta = json.load(f)
+            if meta["params"] != self.params:
+                raise ValueError(
+                    f"Checkpoint {path!r} was written for different parameters"
+                )
+            if root_seed is not None and root_seed != meta["root_seed"]:
+                raise ValueError(
+                    f"Checkpoint {path!r} was written with root seed {meta['root_seed']}"
+                )
+            self.root_seed = meta["root_seed"]
+        else:
+            # Resuming needs every batch to get the same seeds again, so a
+            # checkpointed run always has a root seed
+            if root_seed is None:
+                root_seed = int(np.random.SeedSequence().entropy)
+            self.root_seed = root_seed
+            os.makedirs(path, exist_ok=True)
+            _write_atomic(
+                meta_file,
+                lambda f: f.write(
+                    json.dumps({"params": self.params, "root_seed": root_seed}).encode()
+                ),
+            )
+
+    def _chunk_file(self, first_trial):
+        return os.path.join(self.path, f"chunk_{first_trial:012d}.npz")
+
+    def has_chunk(self, first_trial):
+        return os.path.exists(self._chunk_file(first_trial))
+
+    def save_chunk(self, first_trial, records):
+        _write_atomic(
+            self._chunk_file(first_trial),
+            lambda f: np.savez(
+                f,
+                first_trial=first_trial,
+                **{f"records_{i}": r for i, r in enumerate(records)},
+            ),
+        )
+
+    def load_chunk(self, first_trial):
+        with np.load(self._chunk_file(first_trial)) as data:
+            count = sum(name.startswith("records_") for name in data.files)
+            return [data[f"records_{i}"] for i in range(count)]
+
+    def get_completed(self):
+        # First trial of every saved batch, in order
+        return sorted(
+            int(name[len("chunk_") : -len(".npz")])
+            for name in os.listdir(self.path)
+            if name.startswith("chunk_") and name.endswith(".npz")
+        )
+
+    def load_records(self):
+        # Every saved trial, as one records array per candidate
+        chunks = [self.load_chunk(first_trial) for first_trial in self.get_completed()]
+        return [np.concatenate(candidate) for candidate in zip(*chunks)]
+
+    def save_state(self, state):
+        _write_atomic(
+            os.path.join(self.path, STATE_FILE),
+            lambda f: f.write(json.dumps(state, default=repr).encode()),
+        )
+
+    def load_state(self):
+        state_file = os.path.join(self.path, STATE_FILE)
+        if not os.path.exists(state_file):
+            return None
+        with open(state_file) as f:
+            return json.load(f)
+
+    def __repr__(self) -> str:
+        return f"Checkpoint({self.path}, {len(self.get_completed())} chunks)"
@@ -0,0 +1,115 @@
+from collections import deque
+import functools
+import math
+from multiprocessing import cpu_count, Pool, resource_tracker
+from multiprocessing.pool import ThreadPool
+
+
+BACKENDS = ("serial", "thread", "process")
+
+
+class Executor:
+    # A worker pool that lives for a whole session instead of one call.
+    # Work is handed out in chunks of `chunk_size` trials, so each task
+    # pickles its arguments once per chunk rather than once per trial.
+    #
+    # "thread" suits the batched NumPy paths, which spend most of their time
+    # in code that releases the GIL; "process" suits the per-turn run_trial
+    # path; "serial" runs everything inline, which helps when profiling.
+
+    def __init__(self, backend="process", workers=None, chunk_size=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        self.backend = backend
+        self.workers = 1 if backend == "serial" else (workers or cpu_count())
+        self.chunk_size = chunk_size
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            if self.backend == "thread":
+                self._pool = ThreadPool(self.workers)
+            elif self.backend == "process":
+                # Workers share the parent's resource tracker; one they
+                # started themselves would report every shared memory segment
+                # they attached to as leaked
+                resource_tracker.ensure_running()
+                self._pool = Pool(self.workers)
+        return self._pool
+
+    def start(self):
+        # Starts the workers now rather than on the first task. Workers forked
+        # later inherit whatever the parent has mapped by then.
+        self._get_pool()
+
+    def get_chunk_size(self, count, max_chunk_size=1000):
+        # Without an explicit size, aim for a few chunks per worker so that
+        # uneven chunks still balance out.
+        return self.chunk_size or min(
+            max_chunk_size, max(1, math.ceil(count / (self.workers * 4)))
+        )
+
+    def chunks(self, items, max_chunk_size=1000):
+        chunk_size = self.get_chunk_size(len(items), max_chunk_size)
+        return [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    def ranges(self, count, start=0, max_chunk_size=1000):
+        # (start, size) of each chunk of `count` items from `start`, for
+        # callers that build each chunk's items only when it is handed out
+        chunk_size = self.get_chunk_size(count, max_chunk_size)
+        for offset in range(0, count, chunk_size):
+            yield start + offset, min(chunk_size, count - offset)
+
+    def map(self, fn, tasks):
+        if self.backend == "serial":
+            return [fn(task) for task in tasks]
+        return self._get_pool().map(fn, tasks, chunksize=1)
+
+    def imap(self, fn, tasks):
+        # Like map, but yields each result as soon as it (and every result
+        # before it) is ready, so callers can fold results in as they arrive
+        if self.backend == "serial":
+            return (fn(task) for task in tasks)
+        return self._imap_ahead(fn, tasks)
+
+    def _imap_ahead(self, fn, tasks):
+        # Pool.imap would pull every task off `tasks` at once. Keeping only a
+        # few tasks per worker in flight lets tasks be generated lazily, so
+        # the parent holds a fixed number of them however long the run.
+        pool = self._get_pool()
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(fn, (task,)))
+            if len(pending) >= self.workers * 4:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"Executor({self.backend}, workers={self.workers}, chunk_size={self.chunk_size})"
+
+
+def with_executor(fn):
+    # Lets a driver take an optional `executor`. Without one, a default
+    # Executor is opened for the duration of the call and shared by
+    # everything it runs.
+    @functools.wraps(fn)
+    def wrapper(*args, executor=None, **kwargs):
+        if executor is not None:
+            return fn(*args, executor=executor, **kwargs)
+        with Executor() as executor:
+            return fn(*args, executor=executor, **kwargs)
+
+    return wrapper
@@ -1,58 +1,156 @@
+import json
 import os
 import numpy as np
 
 import prettytable
 
 
-def get_pct_moves(filename):
+CACHE_DIR_NAME = ".price_cache"
+
+
+def _column_name(header):
+    return header.strip().lower().replace(" ", "_")
+
+
+def parse_price_csv(filename):
+    # One pass over the file into NumPy columns named after the header
+    # ("Adj Close" -> "adj_close"). Date columns become datetime64[D]; empty,
+    # missing or "null" cells become NaN and everything else is float.
     with open(filename, "r") as f:
-        lines = f.readlines()[1:]  # Skip the header
-        pct_moves = []
-        for i, line in enumerate(lines[1:]):  # Skip the first open price
-            prev_open_price = float(lines[i - 1].split(",")[1])
-            open_price = float(line.split(",")[1])
-            pct_moves.append((open_price - prev_open_price) / prev_open_price * 100)
-    return pct_moves
+        names = [_column_name(h) for h in f.readline().split(",")]
+        rows = [line.strip().split(",") for line in f if line.strip()]
+    cells = np.array([row + [""] * (len(names) - len(row)) for row in rows], dtype=str)
+    cells = np.char.strip(cells)
+
+    columns = {}
+    for i, name in enumerate(names):
+        if name == "date":
+            columns[name] = cells[:, i].astype("datetime64[D]")
+        else:
+            missing = (cells[:, i] == "") | (cells[:, i] == "null")
+            columns[name] = np.where(missing, "nan", cells[:, i]).astype(float)
+    return columns
+
+
+def _cache_paths(filename, cache_dir):
+    stem = os.path.basename(filename).rsplit(".", 1)[0]
+    return os.path.join(cache_dir, f"{stem}.meta.json"), os.path.join(cache_dir, stem)
+
+
+def load_price_columns(filename, cache_dir=None):
+    # Parsed columns are cached next to the CSV as .npy files and memory-mapped
+    # on later loads. The cache is rebuilt whenever the CSV's mtime or size
+    # changes.
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(filename), CACHE_DIR_NAME)
+    meta_file, column_prefix = _cache_paths(filename, cache_dir)
+    source = os.stat(filename)
+    signature = {"mtime_ns": source.st_mtime_ns, "size": source.st_size}
+
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta["source"] == signature:
+            return {
+                name: np.load(f"{column_prefix}.{name}.npy", mmap_mode="r")
+                for name in meta["columns"]
+            }
+
+    columns = parse_price_csv(filename)
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, values in columns.items():
+        np.save(f"{column_prefix}.{name}.npy", values)
+    # Written last, so a half-written cache is never taken as valid
+    with open(meta_file, "w") as f:
+        json.dump({"source": signature, "columns": list(columns)}, f)
+    return columns
+
+
+def get_moves(filename, column="open"):
+    # Day-over-day moves of one price column, as (pct moves, log moves)
+    prices = np.asarray(load_price_columns(filename)[column])
+    ratios = prices[1:] / prices[:-1]
+    return (ratios - 1) * 100, np.log(ratios)
+
+
+def get_pct_moves(filename):
+    return get_moves(filename)[0]
 
 
 def get_log_moves(filename):
-    with open(filename, "r") as f:
-        lines = f.readlines()[1:]  # Skip the header
-        log_moves = []
-        for i, line in enumerate(lines[1:]):  # Skip the first open price
-            prev_open_price = float(lines[i - 1].split(",")[1])
-            open_price = float(line.split(",")[1])
-            log_moves.append(np.log(open_price / prev_open_price))
-    return log_moves
+    return get_moves(filename)[1]
 
 
 def show_summary_data(filename):
     pct_moves = get_pct_moves(filename)
+    p5, p25, p50, p75, p95 = np.percentile(pct_moves, [5, 25, 50, 75, 95])
     print(f"Mean: {np.mean(pct_moves):.3f}")
     print(f"Standard deviation: {np.std(pct_moves):.3f}")
     print(
-        f"P5: {np.percentile(pct_moves, 5):.4f} \
-        P25: {np.percentile(pct_moves, 25):.4f} \
-        P50: {np.percentile(pct_moves, 50):.4f} \
-        P75: {np.percentile(pct_moves, 75):.4f} \
-        P95: {np.percentile(pct_moves, 95):.4f}"
+        f"P5: {p5:.4f} \
+        P25: {p25:.4f} \
+        P50: {p50:.4f} \
+        P75: {p75:.4f} \
+        P95: {p95:.4f}"
     )
 
 
 def get_data_row(filename):
-    log_moves = get_log_moves(filename)
-    pct_moves = get_pct_moves(filename)
+    pct_moves, log_moves = get_moves(filename)
+    p5, p50, p95 = np.percentile(pct_moves, [5, 50, 95])
     return [
         os.path.basename(filename).split(".")[0],
-        f"{np.percentile(pct_moves, 5):.4f}",
-        f"{np.percentile(pct_moves, 50):.4f}",
-        f"{np.percentile(pct_moves, 95):.4f}",
+        f"{p5:.4f}",
+        f"{p50:.4f}",
+        f"{p95:.4f}",
         f"{np.mean(log_moves):.6f}",
         f"{np.std(log_moves):.4f}",
     ]
 
 
-def show_summary_data_dir(dir_path):
+# Each file parses in milliseconds, so below this many a worker pool costs
+# more to start than it saves
+PARALLEL_MIN_FILES = 32
+
+
+def get_open_prices(filename):
+    return np.asarray(load_price_columns(filename)["open"])
+
+
+def get_data_rows(filenames, executor=None):
+    # get_data_row for many files at once. Files are loaded (in parallel from
+    # PARALLEL_MIN_FILES up, inline below that) and laid side by side, padded
+    # with NaN to the longest, so every asset's moves, percentiles and log
+    # growth come out of one vectorized pass. Missing prices are skipped.
+    if not filenames:
+        return []
+    if executor is not None and len(filenames) >= PARALLEL_MIN_FILES:
+        columns = executor.map(get_open_prices, filenames)
+    else:
+        columns = [get_open_prices(filename) for filename in filenames]
+    prices = np.full((len(columns), max(map(len, columns))), np.nan)
+    for row, column in zip(prices, columns):
+        row[: len(column)] = column
+    ratios = prices[:, 1:] / prices[:, :-1]
+    pct_moves = (ratios - 1) * 100
+    log_moves = np.log(ratios)
+    p5, p50, p95 = np.nanpercentile(pct_moves, [5, 50, 95], axis=1)
+    means = np.nanmean(log_moves, axis=1)
+    stds = np.nanstd(log_moves, axis=1)
+    return [
+        [
+            os.path.basename(filename).split(".")[0],
+            f"{p5[i]:.4f}",
+            f"{p50[i]:.4f}",
+            f"{p95[i]:.4f}",
+            f"{means[i]:.6f}",
+            f"{stds[i]:.4f}",
+        ]
+        for i, filename in enumerate(filenames)
+    ]
+
+
+def show_summary_data_dir(dir_path, executor=None):
     table = prettytable.PrettyTable()
     table.field_names = [
         "Name",
@@ -62,7 +160,41 @@ def show_summary_data_dir(dir_path):
         "Mean Log Growth",
         "Std Log Growth",
     ]
-    for filename in os.listdir(dir_path):
-        if filename.endswith(".csv"):
-            table.add_row(get_data_row(os.path.join(dir_path, filename)))
+    filenames = [
+        os.path.join(dir_path, filename)
+        for filename in sorted(os.listdir(dir_path))
+        if filename.endswith(".csv")
+    ]
+    for row in get_data_rows(filenames, executor=executor):
+        table.add_row(row)
     print(table)
+
+
+# Price columns tried, in order, when a file has no pct_change column
+PRICE_COLUMNS = ("adj_close", "close", "value", "open")
+
+DEFAULT_RETURNS_SOURCE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "snp_daily_variance.csv"
+)
+
+# Log returns by source file. Each process loads a source at most once, and
+# the arrays are read-only so every trial can share them.
+_log_returns = {}
+
+
+def load_log_returns(filename=None):
+    filename = os.path.abspath(filename or DEFAULT_RETURNS_SOURCE)
+    if filename not in _log_returns:
+        columns = load_price_columns(filename)
+        if "pct_change" in columns:
+            log_returns = np.log1p(np.asarray(columns["pct_change"]) / 100)
+        else:
+            column = next((name for name in PRICE_COLUMNS if name in columns), None)
+            if column is None:
+                raise ValueError(f"No price or pct_change column in {filename!r}")
+            prices = np.asarray(columns[column])
+            log_returns = np.log(prices[1:] / prices[:-1])
+        log_returns = log_returns[np.isfinite(log_returns)]
+        log_returns.flags.writeable = False
+        _log_returns[filename] = log_returns
+    return _log_returns[filename]
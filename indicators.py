@@ -0,0 +1,85 @@
+from collections import deque
+import math
+import operator
+
+
+class RollingMean:
+    # Mean of the last `window` values, kept as a running sum. The sum is
+    # rebuilt from the window every `window` updates so rounding error can't
+    # build up over long runs; that keeps the amortized cost per update O(1).
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+        self.total = 0
+        self._updates_since_resum = 0
+
+    def update(self, value):
+        self.values.append(value)
+        self.total += value
+        if len(self.values) > self.window:
+            self.total -= self.values.popleft()
+
+        self._updates_since_resum += 1
+        if self._updates_since_resum >= self.window:
+            self.total = math.fsum(self.values)
+            self._updates_since_resum = 0
+        return self.value
+
+    @property
+    def value(self):
+        return self.total / len(self.values) if self.values else 0
+
+
+class _RollingExtreme:
+    # Monotonic deque of (index, value) pairs: every value is dropped as soon
+    # as a newer one beats it, so the front is always the window's extreme
+    # and each value is pushed and popped at most once. `beats(new, old)` says
+    # whether a new value replaces an older one.
+
+    def __init__(self, window, beats):
+        self.window = window
+        self.beats = beats
+        self.candidates = deque()
+        self.count = 0
+
+    def update(self, value):
+        while self.candidates and self.beats(value, self.candidates[-1][1]):
+            self.candidates.pop()
+        self.candidates.append((self.count, value))
+        if self.candidates[0][0] <= self.count - self.window:
+            self.candidates.popleft()
+        self.count += 1
+        return self.value
+
+    @property
+    def value(self):
+        return self.candidates[0][1] if self.candidates else 0
+
+
+class RollingMax(_RollingExtreme):
+    def __init__(self, window):
+        super().__init__(window, operator.ge)
+
+
+class RollingMin(_RollingExtreme):
+    def __init__(self, window):
+        super().__init__(window, operator.le)
+
+
+class EMA:
+    # Exponential moving average, seeded with the first value. `span` follows
+    # the usual convention of alpha = 2 / (span + 1).
+
+    def __init__(self, span=None, alpha=None):
+        self.alpha = alpha if alpha is not None else 2 / (span + 1)
+        self.value = 0
+        self.count = 0
+
+    def update(self, value):
+        if self.count == 0:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        self.count += 1
+        return self.value
@@ -0,0 +1,180 @@
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+import os
+import pickle
+import resource
+import threading
+import time
+
+
+# The Instrumentation a worker task reports into, per thread so that thread
+# pool workers don't share one
+_local = threading.local()
+
+_NULL_PHASE = nullcontext()
+
+
+def _peak_rss():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class NullInstrumentation:
+    # Stands in when instrumentation is off. Every hook is a no-op, and imap
+    # hands tasks straight to the executor, so the cost is one call per chunk
+    # or block rather than anything per trial or per turn.
+
+    enabled = False
+
+    def phase(self, name):
+        return _NULL_PHASE
+
+    def timed(self, name, iterable):
+        return iterable
+
+    def imap(self, executor, fn, tasks, trial_count=None, turns=0):
+        return executor.imap(fn, tasks)
+
+    def add_trials(self, trials, turns):
+        pass
+
+    def get_report(self):
+        return None
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+def get_worker_instrumentation():
+    return getattr(_local, "instrumentation", NULL_INSTRUMENTATION)
+
+
+def instrumented_call(task):
+    # Runs one executor task with worker-side instrumentation on, and returns
+    # its result with what the worker measured
+    fn, inner_task = task
+    instrumentation = Instrumentation()
+    _local.instrumentation = instrumentation
+    try:
+        start = time.perf_counter()
+        result = fn(inner_task)
+        busy = time.perf_counter() - start
+    finally:
+        _local.instrumentation = NULL_INSTRUMENTATION
+
+    # Pools pickle the result again to send it back; this measures what that
+    # costs, the in-process backends never pay it
+    start = time.perf_counter()
+    result_bytes = len(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+    serialize = time.perf_counter() - start
+
+    worker = {
+        "worker": f"{os.getpid()}:{threading.get_ident()}",
+        "busy_seconds": busy,
+        "serialize_seconds": serialize,
+        "result_bytes": result_bytes,
+        "phases": dict(instrumentation.phases),
+        "peak_rss_bytes": _peak_rss(),
+    }
+    return result, worker
+
+
+class Instrumentation:
+    # Opt-in record of where a run's time goes. The driver times its own
+    # phases (waiting on workers, aggregation, table rendering) with phase();
+    # tasks sent through imap() time theirs (path generation, strategy
+    # evaluation) in the worker and report back with their results, along
+    # with per-worker busy time for load balance and each process's peak RSS.
+
+    enabled = True
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = defaultdict(float)
+        self.worker_phases = defaultdict(float)
+        self.workers = {}
+        self.trials = 0
+        self.turns = 0
+        self.result_bytes = 0
+        self.serialize_seconds = 0.0
+        self.worker_peak_rss = 0
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def timed(self, name, iterable):
+        # Times each step of an iterator (e.g. a path generator) as `name`
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.phases[name] += time.perf_counter() - start
+                return
+            self.phases[name] += time.perf_counter() - start
+            yield item
+
+    def imap(self, executor, fn, tasks, trial_count=None, turns=0):
+        # executor.imap(fn, tasks), with each task instrumented in its worker.
+        # trial_count(task) gives the trials a task evaluates. Tasks are
+        # taken from the iterator as the executor asks for them, and results
+        # come back in the same order, so their counts queue up in between.
+        counts = deque()
+
+        def instrumented_tasks():
+            for task in tasks:
+                counts.append(trial_count(task) if trial_count else 0)
+                yield fn, task
+
+        results = executor.imap(instrumented_call, instrumented_tasks())
+        while True:
+            with self.phase("wait"):
+                try:
+                    result, worker = next(results)
+                except StopIteration:
+                    return
+            self._add_worker(worker)
+            self.add_trials(counts.popleft(), turns)
+            yield result
+
+    def _add_worker(self, worker):
+        stats = self.workers.setdefault(
+            worker["worker"], {"tasks": 0, "busy_seconds": 0.0}
+        )
+        stats["tasks"] += 1
+        stats["busy_seconds"] += worker["busy_seconds"]
+        for name, seconds in worker["phases"].items():
+            self.worker_phases[name] += seconds
+        self.result_bytes += worker["result_bytes"]
+        self.serialize_seconds += worker["serialize_seconds"]
+        self.worker_peak_rss = max(self.worker_peak_rss, worker["peak_rss_bytes"])
+
+    def add_trials(self, trials, turns):
+        self.trials += trials
+        self.turns += trials * turns
+
+    def get_report(self):
+        wall = time.perf_counter() - self.start
+        busy = [w["busy_seconds"] for w in self.workers.values()]
+        mean_busy = sum(busy) / len(busy) if busy else 0.0
+        return {
+            "wall_seconds": wall,
+            "phases": dict(self.phases),
+            "worker_phases": dict(self.worker_phases),
+            "trials": self.trials,
+            "turns": self.turns,
+            "trials_per_second": self.trials / wall if wall else 0.0,
+            "turns_per_second": self.turns / wall if wall else 0.0,
+            "workers": self.workers,
+            # Busiest worker's time over the average; 1 is perfectly balanced
+            "load_imbalance": max(busy) / mean_busy if mean_busy else None,
+            "result_bytes": self.result_bytes,
+            "serialize_seconds": self.serialize_seconds,
+            "peak_rss_bytes": max(_peak_rss(), self.worker_peak_rss),
+        }
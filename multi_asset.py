@@ -0,0 +1,224 @@
+import functools
+import os
+from textwrap import dedent
+
+import numpy as np
+import prettytable
+
+from aggregation import ExactAggregator
+from executors import with_executor
+from historical_data_processor import load_price_columns
+from results import net_worth_ratios, records_from_batch
+from simulator import draw_seeds
+from strategies import BuyDipThreshold, BuyRegularly
+from vectorized import evaluate_strategies, salary_schedule
+
+
+def load_panel(filenames, column="adj_close"):
+    # Prices of several assets on the dates they all trade (an inner join of
+    # their calendars), as (names, dates, prices of shape (days, assets))
+    names = [os.path.basename(filename).rsplit(".", 1)[0] for filename in filenames]
+    columns = [load_price_columns(filename) for filename in filenames]
+    dates = functools.reduce(np.intersect1d, (c["date"] for c in columns))
+
+    prices = np.empty((len(dates), len(columns)))
+    for i, c in enumerate(columns):
+        prices[:, i] = np.asarray(c[column])[np.searchsorted(c["date"], dates)]
+    # A gap in any one asset drops that date for all of them
+    complete = np.isfinite(prices).all(axis=1)
+    return names, dates[complete], prices[complete]
+
+
+def load_panel_dir(dir_paths, column="adj_close"):
+    if isinstance(dir_paths, str):
+        dir_paths = [dir_paths]
+    return load_panel(
+        [
+            os.path.join(dir_path, filename)
+            for dir_path in dir_paths
+            for filename in sorted(os.listdir(dir_path))
+            if filename.endswith(".csv")
+        ],
+        column=column,
+    )
+
+
+def estimate_log_returns(prices):
+    # Mean vector and covariance matrix of daily log returns, per asset
+    log_returns = np.diff(np.log(prices), axis=0)
+    return log_returns.mean(axis=0), np.atleast_2d(np.cov(log_returns, rowvar=False))
+
+
+def correlated_normals(seeds, turns, assets):
+    # Independent standard normals, shape (trials, turns, assets), one
+    # seeded generator per trial as in draw_normals
+    normals = np.empty((len(seeds), turns, assets))
+    for i, seed in enumerate(seeds):
+        normals[i] = np.random.default_rng(seed).standard_normal((turns, assets))
+    return normals
+
+
+def correlated_gbm_paths(seeds, turns, mean, cov, starting_price=100):
+    # Multi-asset GBM, shape (trials, turns, assets). One Cholesky factor L of
+    # the covariance turns independent normals into correlated shocks with a
+    # single matrix multiply. `mean` is the mean daily log return, as
+    # estimate_log_returns gives it, so it is already the log drift and needs
+    # no variance correction.
+    mean = np.asarray(mean, dtype=float)
+    cov = np.asarray(cov, dtype=float)
+    chol = np.linalg.cholesky(cov)
+    normals = correlated_normals(seeds, turns, len(mean))
+    log_moves = mean + normals @ chol.T
+    return starting_price * np.exp(np.cumsum(log_moves, axis=1))
+
+
+def portfolio_prices(paths, weights):
+    # Price of a buy-and-hold basket that starts with `weights` of its value
+    # in each asset. Every asset starts from the same price, so this is one
+    # matrix multiply over the asset axis, shape (trials, turns).
+    weights = np.asarray(weights, dtype=float)
+    return paths @ (weights / weights.sum())
+
+
+def asset_prices(paths):
+    # Each asset as its own set of trials, shape (trials * assets, turns),
+    # ordered trial-major so row t * assets + a is asset a of trial t
+    return np.ascontiguousarray(paths.transpose(0, 2, 1)).reshape(-1, paths.shape[1])
+
+
+def multi_asset_chunk(task):
+    # Records for one chunk of seeds: one records array per asset, or a single
+    # one for the weighted portfolio when weights are given
+    seeds, mean, cov, weights, trial_kwargs = task
+    turns = trial_kwargs["turns"]
+    paths = correlated_gbm_paths(
+        seeds, turns, mean, cov, starting_price=trial_kwargs["starting_price"]
+    )
+    schedule = salary_schedule(
+        turns, trial_kwargs["salary"], trial_kwargs["salary_interval"]
+    )
+    strategy_kwargs = dict(
+        starting_money=trial_kwargs["starting_money"],
+        dip_threshold=trial_kwargs["dip_threshold"],
+        dip_window=trial_kwargs["dip_window"],
+    )
+
+    if weights is not None:
+        results = evaluate_strategies(
+            portfolio_prices(paths, weights), schedule, seeds, **strategy_kwargs
+        )
+        return [records_from_batch(results)]
+
+    assets = len(mean)
+    results = evaluate_strategies(
+        asset_prices(paths), schedule, np.repeat(seeds, assets), **strategy_kwargs
+    )
+    records = records_from_batch(results)
+    return [records[a::assets] for a in range(assets)]
+
+
+@with_executor
+def run_multi_asset(
+    num_trials,
+    filenames,
+    weights=None,
+    turns=365 * 3,
+    starting_price=100,
+    starting_money=0,
+    salary=100,
+    salary_interval=1,
+    dip_threshold=0.95,
+    dip_window=30,
+    column="adj_close",
+    root_seed=None,
+    executor=None,
+):
+    # Reg Buyer vs Dip Buyer on correlated GBM paths calibrated from the
+    # historical files. Without weights every asset is traded on its own;
+    # with weights (one per file) a single buy-and-hold basket is traded,
+    # which costs about the same however many assets it holds.
+    names, dates, prices = load_panel(filenames, column=column)
+    mean, cov = estimate_log_returns(prices)
+    print(
+        dedent(
+            f"""
+            Starting {num_trials} trials, each running for {turns} turns, with the following parameters:
+            Assets: {", ".join(names)}
+            Calibration: {len(dates)} shared days from {dates[0]} to {dates[-1]}
+            Dip Threshold: {dip_threshold}
+            Dip Window: {dip_window}
+        """
+        )
+    )
+
+    trial_kwargs = dict(
+        turns=turns,
+        starting_price=starting_price,
+        starting_money=starting_money,
+        salary=salary,
+        salary_interval=salary_interval,
+        dip_threshold=dip_threshold,
+        dip_window=dip_window,
+    )
+    labels = names if weights is None else ["Portfolio"]
+    aggregators = [ExactAggregator(starting_price) for _ in labels]
+
+    seeds = draw_seeds(num_trials, root_seed=root_seed)
+    for chunk in executor.imap(
+        multi_asset_chunk,
+        [
+            (seeds_chunk, mean, cov, weights, trial_kwargs)
+            for seeds_chunk in executor.chunks(seeds, max_chunk_size=250)
+        ],
+    ):
+        for aggregator, records in zip(aggregators, chunk):
+            aggregator.add(records)
+
+    table = prettytable.PrettyTable()
+    table.field_names = [
+        "Asset",
+        "Weight",
+        "Mean Log Growth",
+        "Std Log Growth",
+        f"{BuyRegularly.name} vs {BuyDipThreshold.name} (Mean, 95% CI)",
+        "Net Worth (P50)",
+        "Final Price (P50)",
+    ]
+    if weights is None:
+        for name, m, variance, aggregator in zip(names, mean, np.diag(cov), aggregators):
+            median = aggregator.get_record_at(50)
+            table.add_row(
+                [
+                    name,
+                    "",
+                    f"{m:.6f}",
+                    f"{np.sqrt(variance):.4f}",
+                    f"{aggregator.get_mean('ratio'):.3f}x ± {aggregator.get_ci('ratio'):.3f}",
+                    f"{net_worth_ratios(median):.3f}x",
+                    f"${aggregator.get_median('price'):,.2f}",
+                ]
+            )
+    else:
+        weights = np.asarray(weights, dtype=float) / np.sum(weights)
+        aggregator = aggregators[0]
+        median = aggregator.get_record_at(50)
+        for name, weight, m, variance in zip(names, weights, mean, np.diag(cov)):
+            table.add_row(
+                [name, f"{weight:.2%}", f"{m:.6f}", f"{np.sqrt(variance):.4f}", "", "", ""]
+            )
+        table.add_row(
+            [
+                "Portfolio",
+                "100.00%",
+                f"{weights @ mean:.6f}",
+                f"{np.sqrt(weights @ cov @ weights):.4f}",
+                f"{aggregator.get_mean('ratio'):.3f}x ± {aggregator.get_ci('ratio'):.3f}",
+                f"{net_worth_ratios(median):.3f}x",
+                f"${aggregator.get_median('price'):,.2f}",
+            ]
+        )
+    table.align = "r"
+    table.vrules = prettytable.FRAME
+    print(table)
+
+    return aggregators
@@ -0,0 +1,343 @@
+from collections import deque
+import math
+import warnings
+
+import numpy as np
+import scipy.stats as st
+from scipy.stats import qmc
+
+from historical_data_processor import load_log_returns
+
+
+PRICE_MODELS = ("gbm", "basic", "bootstrap")
+
+# How trials' normals are drawn. "antithetic" pairs every trial with one that
+# sees the same normals negated, and "sobol" takes them from scrambled Sobol
+# sequences instead of a pseudo-random generator.
+SAMPLING_METHODS = ("random", "antithetic", "sobol")
+
+# Independently scrambled Sobol sequences that trials are dealt across, so
+# that the spread of their means gives an error estimate
+SOBOL_REPLICATES = 8
+
+# Turns generated at a time when a single trial's path is streamed
+PATH_BLOCK_SIZE = 4096
+
+# Turns built in float64 at a time when generate_paths casts to a narrower
+# dtype as it goes
+CAST_BLOCK_SIZE = 256
+
+
+def seed_rng(seed):
+    # (generator, sign) for a trial seed. A negative seed is the antithetic
+    # twin of ~seed: the same generator, with every normal negated.
+    if seed < 0:
+        return np.random.default_rng(~seed), -1.0
+    return np.random.default_rng(seed), 1.0
+
+
+def draw_normals(seeds, turns):
+    # Each row comes from its own seeded generator, so row i is exactly the
+    # stream run_trial(seed=seeds[i]) would see.
+    normals = np.empty((len(seeds), turns))
+    for i, seed in enumerate(seeds):
+        rng, sign = seed_rng(seed)
+        normals[i] = rng.standard_normal(turns)
+        if sign < 0:
+            np.negative(normals[i], out=normals[i])
+    return normals
+
+
+def sobol_normals(indices, turns, sobol_seed):
+    # Trial i is point i // SOBOL_REPLICATES of scrambled Sobol sequence
+    # i % SOBOL_REPLICATES, one dimension per turn, through the inverse normal
+    # CDF. Any range of trials can be drawn on its own.
+    indices = np.asarray(indices, dtype=np.int64)
+    replicates = indices % SOBOL_REPLICATES
+    points = indices // SOBOL_REPLICATES
+    normals = np.empty((len(indices), turns))
+    for replicate in np.unique(replicates):
+        rows = np.flatnonzero(replicates == replicate)
+        first = int(points[rows].min())
+        sampler = qmc.Sobol(
+            turns,
+            scramble=True,
+            seed=np.random.default_rng([sobol_seed, int(replicate)]),
+        )
+        if first:
+            sampler.fast_forward(first)
+        with warnings.catch_warnings():
+            # Chunks are rarely a power of two points, which only matters
+            # for the balance of a single chunk, not of the whole sequence
+            warnings.simplefilter("ignore", UserWarning)
+            uniforms = sampler.random(points[rows].max() - first + 1)
+        uniforms = np.clip(uniforms[points[rows] - first], 1e-12, 1 - 1e-12)
+        normals[rows] = st.norm.ppf(uniforms)
+    return normals
+
+
+def brownian_bridge(normals):
+    # Turns iid normals into iid normal steps whose first columns set the
+    # path's coarse shape: column 0 fixes where it ends, the next ones its
+    # midpoints, and so on down. Sobol points are most even in their first
+    # dimensions, so this puts them where they matter most.
+    trials, turns = normals.shape
+    walk = np.zeros((turns + 1, trials))
+    walk[turns] = math.sqrt(turns) * normals[:, 0]
+    column = 1
+    intervals = deque([(0, turns)])
+    while intervals:
+        left, right = intervals.popleft()
+        if right - left < 2:
+            continue
+        mid = (left + right) // 2
+        walk[mid] = ((right - mid) * walk[left] + (mid - left) * walk[right]) / (
+            right - left
+        ) + math.sqrt((mid - left) * (right - mid) / (right - left)) * normals[:, column]
+        column += 1
+        intervals.append((left, mid))
+        intervals.append((mid, right))
+    return np.diff(walk, axis=0).T
+
+
+def gbm_paths(normals, starting_price, mean, stddev):
+    # Same step as update_price, S = S * e^((μ−1/2​σ^2)+σ*w), done as a
+    # cumulative sum of log moves.
+    log_moves = (mean - 0.5 * stddev**2) + stddev * normals
+    return starting_price * np.exp(np.cumsum(log_moves, axis=-1))
+
+
+def basic_paths(normals, starting_price, mean, stddev):
+    # Same step as update_price_basic, S = max(S + S * v, 1). In log space the
+    # floor at 1 is a walk reflected at 0, which has the closed form
+    # W_t = S_t - min(0, min_{s<=t} S_s).
+    growth = np.maximum(1 + mean + stddev * normals, np.finfo(float).tiny)
+    walk = np.log(starting_price) + np.cumsum(np.log(growth), axis=-1)
+    floor = np.minimum(np.minimum.accumulate(walk, axis=-1), 0)
+    return np.exp(walk - floor)
+
+
+def paths_from_normals(
+    normals,
+    starting_price=100,
+    growth_midpoint=0.002,
+    growth_stddev=0.01,
+    price_model="gbm",
+):
+    if price_model == "gbm":
+        return gbm_paths(normals, starting_price, growth_midpoint, growth_stddev)
+    if price_model == "basic":
+        return basic_paths(normals, starting_price, growth_midpoint, growth_stddev)
+    raise ValueError(f"Unknown price model {price_model!r}, expected one of {PRICE_MODELS}")
+
+
+def iter_bootstrap_indices(
+    seeds, turns, sample_size, block_length=1, block_size=PATH_BLOCK_SIZE
+):
+    # Days to take each turn's return from, one row per seed, a block of turns
+    # at a time. This is the stationary bootstrap (Politis & Romano): each turn
+    # starts a new run at a random day with probability 1 / block_length,
+    # otherwise it takes the day after the previous turn's, wrapping at the
+    # end of the sample. Runs keep the volatility clustering of the real
+    # series; block_length=1 is plain iid resampling.
+    #
+    # Run starts and the uniforms deciding new runs come from two separate
+    # generators per seed, so each is one unbroken stream whatever the block
+    # size, and the days don't depend on how the turns are split into blocks.
+    start_rngs = [np.random.default_rng(seed) for seed in seeds]
+    run_rngs = [
+        np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(1,)))
+        for seed in seeds
+    ]
+    previous = np.zeros((len(seeds), 1), dtype=np.int64)
+    for start in range(0, turns, block_size):
+        count = min(block_size, turns - start)
+        starts = np.empty((len(seeds), count), dtype=np.int64)
+        uniforms = np.empty((len(seeds), count))
+        for i, (start_rng, run_rng) in enumerate(zip(start_rngs, run_rngs)):
+            starts[i] = start_rng.integers(0, sample_size, count)
+            if block_length > 1:
+                uniforms[i] = run_rng.random(count)
+        if block_length <= 1:
+            yield starts
+            continue
+        new_run = uniforms < 1 / block_length
+        if start == 0:
+            new_run[:, 0] = True
+
+        # Turns before a row's first new run carry on from the previous block
+        turn = np.arange(count)
+        run_start = np.maximum.accumulate(np.where(new_run, turn, -1), axis=-1)
+        indices = np.where(
+            run_start >= 0,
+            np.take_along_axis(starts, run_start, axis=-1) + turn - run_start,
+            previous + 1 + turn,
+        ) % sample_size
+        previous = indices[:, -1:]
+        yield indices
+
+
+def bootstrap_indices(seeds, turns, sample_size, block_length=1):
+    # Row i is the same days run_trial(seed=seeds[i]) streams
+    return np.concatenate(
+        list(iter_bootstrap_indices(seeds, turns, sample_size, block_length)),
+        axis=-1,
+    )
+
+
+def generate_paths(
+    seeds,
+    turns,
+    starting_price=100,
+    growth_midpoint=0.002,
+    growth_stddev=0.01,
+    price_model="gbm",
+    returns_source=None,
+    block_length=1,
+    sobol_seed=None,
+    dtype=None,
+):
+    # With a sobol_seed, seeds are Sobol trial indices (see sobol_normals).
+    # With a dtype other than float64, e.g. np.float32, the paths are built a
+    # block at a time and cast as they go, so the float64 paths never exist
+    # whole; Sobol paths need every turn at once and are cast at the end.
+    if dtype is not None and np.dtype(dtype) != np.float64 and sobol_seed is None:
+        prices = np.empty((len(seeds), turns), dtype=dtype)
+        start = 0
+        for block in iter_path_blocks(
+            seeds,
+            turns,
+            starting_price=starting_price,
+            growth_midpoint=growth_midpoint,
+            growth_stddev=growth_stddev,
+            price_model=price_model,
+            returns_source=returns_source,
+            block_length=block_length,
+            block_size=CAST_BLOCK_SIZE,
+            dtype=dtype,
+        ):
+            prices[:, start : start + block.shape[1]] = block
+            start += block.shape[1]
+        return prices
+    if price_model == "bootstrap":
+        # Resampled real daily log returns; the growth parameters don't apply
+        if sobol_seed is not None:
+            raise ValueError("Sobol sampling needs a normal price model")
+        log_returns = load_log_returns(returns_source)
+        indices = bootstrap_indices(seeds, turns, len(log_returns), block_length)
+        return starting_price * np.exp(np.cumsum(log_returns[indices], axis=-1))
+    if sobol_seed is not None:
+        normals = brownian_bridge(sobol_normals(seeds, turns, sobol_seed))
+    else:
+        normals = draw_normals(seeds, turns)
+    prices = paths_from_normals(
+        normals,
+        starting_price=starting_price,
+        growth_midpoint=growth_midpoint,
+        growth_stddev=growth_stddev,
+        price_model=price_model,
+    )
+    if dtype is not None:
+        prices = prices.astype(dtype, copy=False)
+    return prices
+
+
+def iter_price_blocks(
+    seed,
+    turns,
+    starting_price=100,
+    growth_midpoint=0.002,
+    growth_stddev=0.01,
+    price_model="gbm",
+    returns_source=None,
+    block_length=1,
+    block_size=PATH_BLOCK_SIZE,
+    sobol_seed=None,
+):
+    # Yields one trial's path a block at a time. Successive draws from one
+    # generator continue the same normal stream, so the blocks join up into
+    # the path generate_paths would give for this seed. A Sobol path (seed is
+    # its trial index) comes as one block, since the Brownian bridge sets
+    # every turn at once.
+    if sobol_seed is not None:
+        yield generate_paths(
+            [seed],
+            turns,
+            starting_price=starting_price,
+            growth_midpoint=growth_midpoint,
+            growth_stddev=growth_stddev,
+            price_model=price_model,
+            sobol_seed=sobol_seed,
+        )[0]
+        return
+
+    price = starting_price
+    if price_model == "bootstrap":
+        log_returns = load_log_returns(returns_source)
+        for indices in iter_bootstrap_indices(
+            [seed], turns, len(log_returns), block_length, block_size=block_size
+        ):
+            block = price * np.exp(np.cumsum(log_returns[indices[0]]))
+            price = block[-1]
+            yield block
+        return
+
+    rng, sign = seed_rng(seed)
+    for start in range(0, turns, block_size):
+        block = paths_from_normals(
+            sign * rng.standard_normal(min(block_size, turns - start)),
+            starting_price=price,
+            growth_midpoint=growth_midpoint,
+            growth_stddev=growth_stddev,
+            price_model=price_model,
+        )
+        price = block[-1]
+        yield block
+
+
+def iter_path_blocks(
+    seeds,
+    turns,
+    starting_price=100,
+    growth_midpoint=0.002,
+    growth_stddev=0.01,
+    price_model="gbm",
+    returns_source=None,
+    block_length=1,
+    block_size=PATH_BLOCK_SIZE,
+    dtype=np.float64,
+):
+    # Every trial's path as (trials, block_size) blocks of turns, for horizons
+    # where the whole (trials, turns) array wouldn't fit. Each row carries on
+    # from its last price in the previous block, so the blocks join up into
+    # the paths generate_paths gives. Blocks are built in float64 from float64
+    # last prices and only then cast to `dtype`, so a float32 path is the
+    # float64 one rounded rather than a walk that drifts off it.
+    prices = np.full((len(seeds), 1), float(starting_price))
+    if price_model == "bootstrap":
+        log_returns = load_log_returns(returns_source)
+        for indices in iter_bootstrap_indices(
+            seeds, turns, len(log_returns), block_length, block_size=block_size
+        ):
+            block = prices * np.exp(np.cumsum(log_returns[indices], axis=-1))
+            prices = block[:, -1:]
+            yield block.astype(dtype, copy=False)
+        return
+
+    rngs = [seed_rng(seed) for seed in seeds]
+    normals = np.empty((len(seeds), min(block_size, turns)))
+    for start in range(0, turns, block_size):
+        count = min(block_size, turns - start)
+        for i, (rng, sign) in enumerate(rngs):
+            normals[i, :count] = rng.standard_normal(count)
+            if sign < 0:
+                np.negative(normals[i, :count], out=normals[i, :count])
+        block = paths_from_normals(
+            normals[:, :count],
+            starting_price=prices,
+            growth_midpoint=growth_midpoint,
+            growth_stddev=growth_stddev,
+            price_model=price_model,
+        )
+        prices = block[:, -1:]
+        yield block.astype(dtype, copy=False)
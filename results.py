@@ -0,0 +1,66 @@
+import numpy as np
+
+from strategies import BuyDipThreshold, BuyRegularly, NeverBuy
+from vectorized import BatchResult, safe_ratio
+
+
+# Record field for each strategy the drivers report on
+STRATEGY_FIELDS = {
+    BuyRegularly.name: "reg",
+    BuyDipThreshold.name: "dip",
+    NeverBuy.name: "never",
+}
+
+STRATEGY_DTYPE = np.dtype(
+    [
+        ("net_worth", "f8"),
+        ("avg_price", "f8"),
+        ("buy_count", "i8"),
+        ("peak_count", "i8"),
+        ("last_price", "f8"),
+    ]
+)
+
+TRIAL_DTYPE = np.dtype(
+    [("seed", "i8")]
+    + [(field, STRATEGY_DTYPE) for field in STRATEGY_FIELDS.values()]
+    + [("dca_value", "f8")]
+)
+
+
+def records_from_batch(results):
+    # results maps strategy name -> BatchResult, as evaluate_strategies returns
+    records = np.empty(len(results[BuyRegularly.name]), dtype=TRIAL_DTYPE)
+    records["seed"] = results[BuyRegularly.name].seed
+    records["dca_value"] = results[BuyRegularly.name].dca_value
+    for name, field in STRATEGY_FIELDS.items():
+        result = results[name]
+        records[field]["net_worth"] = result.get_net_worth()
+        records[field]["avg_price"] = result.get_avg_price()
+        records[field]["buy_count"] = result.buy_count
+        records[field]["peak_count"] = result.peak_count
+        records[field]["last_price"] = result.last_price
+    return records
+
+
+def records_from_trials(trials):
+    # trials is a list of run_trial return values
+    by_name = {name: [] for name in STRATEGY_FIELDS}
+    for strategies, _ in trials:
+        for s in strategies:
+            by_name[s.name].append(s)
+    return records_from_batch(
+        {name: BatchResult.from_strategies(s) for name, s in by_name.items()}
+    )
+
+
+def net_worth_ratios(records):
+    return safe_ratio(records["reg"]["net_worth"], records["dip"]["net_worth"])
+
+
+def avg_price_ratios(records):
+    return safe_ratio(records["reg"]["avg_price"], records["dip"]["avg_price"])
+
+
+def buy_count_ratios(records):
+    return safe_ratio(records["reg"]["buy_count"], records["dip"]["buy_count"])
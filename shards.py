@@ -0,0 +1,216 @@
+import argparse
+import json
+
+import numpy as np
+
+from aggregation import ExactAggregator, RunningStats
+from executors import BACKENDS, Executor, with_executor
+from paths import PRICE_MODELS
+from simulator import (
+    add_threshold_chunk,
+    collect_thresholds,
+    get_seed_name,
+    print_thresholds_headline,
+    thresholds_table,
+)
+
+
+# Settings that every shard of one run must share
+_RUN_KEYS = (
+    "shards",
+    "num_trials",
+    "turns",
+    "dip_thresholds",
+    "dip_window",
+    "root_seed",
+    "common_paths",
+    "trial_kwargs",
+)
+
+
+def shard_range(num_trials, shard, shards):
+    # (first trial, trial count) of shard `shard` out of `shards`
+    if not 0 <= shard < shards:
+        raise ValueError(f"Shard {shard} is out of range for {shards} shards")
+    first = num_trials * shard // shards
+    return first, num_trials * (shard + 1) // shards - first
+
+
+@with_executor
+def run_shard(
+    filename,
+    shard,
+    shards,
+    num_trials,
+    turns,
+    dip_thresholds,
+    root_seed,
+    dip_window=30,
+    growth_midpoint=0.0006,
+    growth_stddev=0.0094,
+    starting_price=100,
+    starting_money=0,
+    salary=100,
+    salary_interval=1,
+    vectorized=False,
+    common_paths=False,
+    executor=None,
+    **kwargs,
+):
+    # Runs one shard of run_many_thresholds(num_trials, ..., root_seed=...)
+    # and saves its records to `filename` (.npz). Trial seeds depend only on
+    # root_seed and the trial's index, so the shards together hold exactly
+    # the trials the unsharded run would.
+    first_trial, shard_trials = shard_range(num_trials, shard, shards)
+    trial_kwargs = dict(
+        turns=turns,
+        starting_money=starting_money,
+        salary=salary,
+        salary_interval=salary_interval,
+        starting_price=starting_price,
+        growth_midpoint=growth_midpoint,
+        growth_stddev=growth_stddev,
+        **kwargs,
+    )
+    aggregators, _ = collect_thresholds(
+        shard_trials,
+        dip_thresholds,
+        dip_window,
+        executor,
+        vectorized=vectorized,
+        common_paths=common_paths,
+        root_seed=root_seed,
+        first_trial=first_trial,
+        **trial_kwargs,
+    )
+
+    meta = {
+        "shard": shard,
+        "shards": shards,
+        "num_trials": num_trials,
+        "turns": turns,
+        "dip_thresholds": list(dip_thresholds),
+        "dip_window": dip_window,
+        "root_seed": root_seed,
+        "common_paths": common_paths,
+        "trial_kwargs": trial_kwargs,
+    }
+    np.savez(
+        filename,
+        meta=np.array(json.dumps(meta)),
+        **{f"records_{i}": a.get_records() for i, a in enumerate(aggregators)},
+    )
+
+
+def load_shard(filename):
+    with np.load(filename) as data:
+        meta = json.loads(str(data["meta"]))
+        records = [data[f"records_{i}"] for i in range(len(meta["dip_thresholds"]))]
+    return meta, records
+
+
+def merge_shards(filenames, include_extras=False):
+    # Rebuilds the tables run_many_thresholds prints from a complete set of
+    # shard files
+    shards = sorted(
+        (load_shard(filename) for filename in filenames),
+        key=lambda shard: shard[0]["shard"],
+    )
+    meta = shards[0][0]
+    for other, _ in shards[1:]:
+        mismatched = [key for key in _RUN_KEYS if other[key] != meta[key]]
+        if mismatched:
+            raise ValueError(
+                f"Shards come from different runs: {', '.join(mismatched)} differ"
+            )
+    found = [shard_meta["shard"] for shard_meta, _ in shards]
+    if found != list(range(meta["shards"])):
+        raise ValueError(f"Expected shards 0 to {meta['shards'] - 1}, found {found}")
+
+    dip_thresholds = meta["dip_thresholds"]
+    trial_kwargs = meta["trial_kwargs"]
+    aggregators = [
+        ExactAggregator(trial_kwargs["starting_price"]) for _ in dip_thresholds
+    ]
+    difference_stats = (
+        [RunningStats() for _ in dip_thresholds] if meta["common_paths"] else None
+    )
+    for _, records in shards:
+        if difference_stats is None:
+            for aggregator, threshold_records in zip(aggregators, records):
+                aggregator.add(threshold_records)
+        else:
+            add_threshold_chunk(aggregators, difference_stats, records)
+
+    print_thresholds_headline(
+        meta["num_trials"],
+        meta["turns"],
+        dip_thresholds,
+        meta["dip_window"],
+        trial_kwargs["growth_midpoint"],
+        trial_kwargs["growth_stddev"],
+    )
+    print(
+        thresholds_table(
+            dip_thresholds,
+            aggregators,
+            difference_stats=difference_stats,
+            include_extras=include_extras,
+            seed_name=get_seed_name(trial_kwargs.get("sampling")),
+        )
+    )
+    return aggregators
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Split run_many_thresholds across processes or machines"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run one shard and save its records")
+    run.add_argument("output", help="shard file to write (.npz)")
+    run.add_argument("--shard", type=int, required=True)
+    run.add_argument("--shards", type=int, required=True)
+    run.add_argument("--trials", type=int, required=True)
+    run.add_argument("--root-seed", type=int, required=True)
+    run.add_argument("--thresholds", type=float, nargs="+", required=True)
+    run.add_argument("--window", type=int, default=30)
+    run.add_argument("--turns", type=int, default=365 * 3)
+    run.add_argument("--growth-midpoint", type=float, default=0.0006)
+    run.add_argument("--growth-stddev", type=float, default=0.0094)
+    run.add_argument("--price-model", choices=PRICE_MODELS, default="gbm")
+    run.add_argument("--vectorized", action="store_true")
+    run.add_argument("--common-paths", action="store_true")
+    run.add_argument("--backend", choices=BACKENDS, default="process")
+    run.add_argument("--workers", type=int)
+
+    merge = commands.add_parser("merge", help="print the tables for a set of shards")
+    merge.add_argument("files", nargs="+")
+    merge.add_argument("--include-extras", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        with Executor(args.backend, workers=args.workers) as executor:
+            run_shard(
+                args.output,
+                args.shard,
+                args.shards,
+                args.trials,
+                args.turns,
+                args.thresholds,
+                args.root_seed,
+                dip_window=args.window,
+                growth_midpoint=args.growth_midpoint,
+                growth_stddev=args.growth_stddev,
+                price_model=args.price_model,
+                vectorized=args.vectorized,
+                common_paths=args.common_paths,
+                executor=executor,
+            )
+    else:
+        merge_shards(args.files, include_extras=args.include_extras)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _release(shm, unlink):
+    try:
+        shm.close()
+    except BufferError:
+        # Arrays still view the segment; the mapping goes when they do
+        pass
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedPathStore:
+    # A (trials, turns) price array in a shared memory segment. The parent
+    # creates and fills it once; workers attach by name through `handle` and
+    # slice out their trials without copying. The creating side unlinks the
+    # segment on close(), when the store is garbage collected or at
+    # interpreter exit, and multiprocessing's resource tracker unlinks it if
+    # the parent dies before any of those run. Workers attach for one task at
+    # a time and close() their side when it is done, so no mapping of the
+    # segment outlives the run.
+
+    def __init__(self, shape, dtype=np.float64, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        if self.owner:
+            size = max(int(np.prod(self.shape)) * self.dtype.itemsize, 1)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        self._finalizer = weakref.finalize(self, _release, self.shm, self.owner)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def handle(self):
+        # Everything a worker needs to attach; small enough to send per task
+        return self.name, self.shape, self.dtype.str
+
+    @classmethod
+    def attach(cls, handle):
+        name, shape, dtype = handle
+        return cls(shape, dtype=dtype, name=name)
+
+    def close(self):
+        # Views of `array` must not be used after this
+        self.array = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"SharedPathStore({self.name}, shape={self.shape}, dtype={self.dtype})"
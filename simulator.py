@@ -1,16 +1,63 @@
-from collections import defaultdict
+import inspect
 import math
-from multiprocessing import cpu_count, Pool
+import os
 import random
 from textwrap import dedent
+import time
 
-import matplotlib.pyplot as plt
 import numpy as np
 import prettytable
 import scipy.stats as st
 
-from strategies import BuyRegularly, BuyDipThreshold, NeverBuy
+from charts import chart_fan, chart_trial
+from checkpoint import Checkpoint
+from executors import with_executor
+from historical_data_processor import load_log_returns
+from instrumentation import (
+    Instrumentation,
+    NULL_INSTRUMENTATION,
+    get_worker_instrumentation,
+)
+from paths import (
+    SAMPLING_METHODS,
+    generate_paths,
+    iter_path_blocks,
+    iter_price_blocks,
+)
+from shared_paths import SharedPathStore
+from strategies import (
+    BuyRegularly,
+    BuyDipThreshold,
+    NeverBuy,
+    HISTORY_FULL,
+    HISTORY_NONE,
+)
+from tracing import TRACE_DETAIL, get_tracer
 from utilities import cond_print
+from aggregation import (
+    ExactAggregator,
+    get_estimates,
+    RunningStats,
+    StreamingAggregator,
+    TurnHistograms,
+)
+from results import (
+    STRATEGY_FIELDS,
+    TRIAL_DTYPE,
+    avg_price_ratios,
+    buy_count_ratios,
+    net_worth_ratios,
+    records_from_batch,
+    records_from_trials,
+)
+from vectorized import (
+    StreamingEvaluation,
+    dip_threshold_mask,
+    evaluate_candidates,
+    evaluate_strategies,
+    run_purchases,
+    salary_schedule,
+)
 
 
 def update_price_basic(rng, price, mean, stddev):
@@ -38,18 +85,33 @@ def run_trial(
     growth_stddev=0.01,
     dip_threshold=0.95,
     dip_window=30,
+    price_model="gbm",
+    returns_source=None,
+    block_length=1,
+    history=HISTORY_FULL,
     print_summary=False,
     print_details=False,
     show_chart=None,
+    tracer=None,
+    sobol_seed=None,
 ):
+    # print_details prints every trace event; pass a `tracer` (see tracing.py)
+    # to capture them instead. show_chart=True shows the trial's chart, and a
+    # filename (.png, .svg, ...) writes it there instead. With a sobol_seed
+    # (a Sobol run's root seed), `seed` is the trial's Sobol index.
     if seed is None:
         seed = random.randint(0, 999999999)
-    rng = np.random.default_rng(seed)
+    if show_chart and history != HISTORY_FULL:
+        raise ValueError("show_chart needs history='full'")
 
+    tracer = get_tracer(tracer, print_details)
+    trace_prices = tracer.level >= TRACE_DETAIL
     strategy_kwargs = {
         "seed": seed,
         "starting_money": starting_money,
         "print_details": print_details,
+        "history": history,
+        "tracer": tracer,
     }
     reg_strategy = BuyRegularly(**strategy_kwargs)
     buy_dip_strategy = BuyDipThreshold(
@@ -69,58 +131,586 @@ def run_trial(
 
     price = starting_price
     turn_count = 0
+    salary_paid = 0
+    salary_over_price = 0
+    instrumentation = get_worker_instrumentation()
+
+    # The path is streamed in blocks so that, below full history, memory
+    # doesn't grow with the number of turns. Instrumentation is per block,
+    # never per turn.
+    for block in instrumentation.timed(
+        "paths",
+        iter_price_blocks(
+            seed,
+            turns,
+            starting_price=starting_price,
+            growth_midpoint=growth_midpoint,
+            growth_stddev=growth_stddev,
+            price_model=price_model,
+            returns_source=returns_source,
+            block_length=block_length,
+            sobol_seed=sobol_seed,
+        ),
+    ):
+        with instrumentation.phase("strategies"):
+            for new_price in block.tolist():
+                payday = turn_count % salary_interval == 0
+                if payday:
+                    for s in strategies:
+                        s.money += salary
+
+                if trace_prices:
+                    tracer.emit(
+                        "price", turn_count, price=new_price, change=new_price - price
+                    )
 
-    while turn_count < turns:
-        if turn_count % salary_interval == 0:
-            for s in strategies:
-                s.money += salary
+                price = new_price
+                if payday:
+                    salary_paid += salary
+                    salary_over_price += salary / price
+                if history == HISTORY_FULL:
+                    all_prices.append(price)
 
-        new_price = update_price(rng, price, growth_midpoint, growth_stddev)
-        cond_print(
-            print_details,
-            f"Price changed by {new_price - price}. New price is {new_price}",
-        )
+                for s in strategies:
+                    s.assess_and_buy(price, turn_count)
 
-        price = new_price
-        all_prices.append(price)
+                turn_count += 1
 
+    if salary_paid:
         for s in strategies:
-            s.assess_and_buy(price, turn_count)
-
-        turn_count += 1
+            s.dca_value = salary_over_price * price / salary_paid
 
     if show_chart:
-        x = range(len(all_prices))
-        plt.plot(x, all_prices, label="Price", color="k")
-        plt.plot(x, buy_dip_strategy.buy_thresholds, "--r", label="Thresholds")
+        chart_trial(
+            all_prices,
+            buy_dip_strategy.buy_thresholds,
+            buy_dip_strategy.buy_turns,
+            filename=show_chart if isinstance(show_chart, str) else None,
+        )
 
-        for t in buy_dip_strategy.buy_turns:
-            plt.axvline(t, linewidth=0.5, color="b")
+    return strategies, price
 
-        plt.xlabel("Day")
-        plt.ylabel("Price")
-        plt.show()
 
-    return strategies, price
+def run_trial_chunk(task):
+    trial_range, trial_kwargs = task
+    seeds = range_seeds(trial_range)
+    # Workers only report records, so skip per-turn history unless a chart
+    # was asked for
+    trial_kwargs = dict(trial_kwargs)
+    trial_kwargs.setdefault(
+        "history", HISTORY_FULL if trial_kwargs.get("show_chart") else HISTORY_NONE
+    )
+    return records_from_trials(
+        [run_trial(seed=seed, **trial_kwargs) for seed in seeds.tolist()]
+    )
 
 
-def run_trial_map_wrapper(kwargs):
-    return run_trial(**kwargs)
+def save_trial_chart(task):
+    # Re-runs one trial with full history and writes its chart to filename
+    seed, filename, trial_kwargs = task
+    run_trial(seed=seed, history=HISTORY_FULL, show_chart=filename, **trial_kwargs)
+    return filename
 
 
-def run_many_thresholds(
-    num_trials,
+def run_trial_batch(
+    seeds,
     turns,
-    dip_thresholds,
+    starting_price=100,
+    starting_money=0,
+    salary=100,
+    salary_interval=1,
+    growth_midpoint=0.002,
+    growth_stddev=0.01,
+    dip_threshold=0.95,
     dip_window=30,
-    growth_midpoint=0.0006,
-    growth_stddev=0.0094,
+    price_model="gbm",
+    returns_source=None,
+    block_length=1,
+    trend_length=None,
+    time_block=None,
+    path_dtype=None,
+    sobol_seed=None,
+):
+    # With a time_block, trials advance through time that many turns at a
+    # time instead of as one (trials, turns) array, so memory follows
+    # time_block x trials rather than the horizon. path_dtype=np.float32
+    # halves the memory the paths take (see generate_paths).
+    if time_block is not None:
+        if sobol_seed is not None:
+            raise ValueError("Sobol sampling needs whole paths, not a time_block")
+        return run_trial_stream(
+            seeds,
+            turns,
+            time_block,
+            starting_price=starting_price,
+            starting_money=starting_money,
+            salary=salary,
+            salary_interval=salary_interval,
+            growth_midpoint=growth_midpoint,
+            growth_stddev=growth_stddev,
+            dip_threshold=dip_threshold,
+            dip_window=dip_window,
+            price_model=price_model,
+            returns_source=returns_source,
+            block_length=block_length,
+            trend_length=trend_length,
+            path_dtype=path_dtype,
+        )
+
+    instrumentation = get_worker_instrumentation()
+    with instrumentation.phase("paths"):
+        prices = generate_paths(
+            seeds,
+            turns,
+            starting_price=starting_price,
+            growth_midpoint=growth_midpoint,
+            growth_stddev=growth_stddev,
+            price_model=price_model,
+            returns_source=returns_source,
+            block_length=block_length,
+            sobol_seed=sobol_seed,
+            dtype=path_dtype,
+        )
+    with instrumentation.phase("strategies"):
+        results = evaluate_strategies(
+            prices,
+            salary_schedule(turns, salary, salary_interval),
+            seeds,
+            starting_money=starting_money,
+            dip_threshold=dip_threshold,
+            dip_window=dip_window,
+            trend_length=trend_length,
+        )
+    return results, prices[:, -1]
+
+
+def run_trial_stream(
+    seeds,
+    turns,
+    time_block,
     starting_price=100,
     starting_money=0,
     salary=100,
     salary_interval=1,
-    include_extras=False,
-    **kwargs,
+    growth_midpoint=0.002,
+    growth_stddev=0.01,
+    dip_threshold=0.95,
+    dip_window=30,
+    price_model="gbm",
+    returns_source=None,
+    block_length=1,
+    trend_length=None,
+    path_dtype=None,
+):
+    instrumentation = get_worker_instrumentation()
+    evaluation = StreamingEvaluation(
+        len(seeds),
+        starting_money=starting_money,
+        salary=salary,
+        salary_interval=salary_interval,
+        dip_threshold=dip_threshold,
+        dip_window=dip_window,
+        trend_length=trend_length,
+    )
+    blocks = iter_path_blocks(
+        seeds,
+        turns,
+        starting_price=starting_price,
+        growth_midpoint=growth_midpoint,
+        growth_stddev=growth_stddev,
+        price_model=price_model,
+        returns_source=returns_source,
+        block_length=block_length,
+        block_size=time_block,
+        dtype=path_dtype or np.float64,
+    )
+    for block in instrumentation.timed("paths", blocks):
+        with instrumentation.phase("strategies"):
+            evaluation.add(block)
+    return evaluation.get_results(seeds), evaluation.last_price
+
+
+def run_candidate_batch(
+    seeds,
+    turns,
+    candidates,
+    starting_price=100,
+    starting_money=0,
+    salary=100,
+    salary_interval=1,
+    growth_midpoint=0.002,
+    growth_stddev=0.01,
+    price_model="gbm",
+    returns_source=None,
+    block_length=1,
+    sobol_seed=None,
+    path_dtype=None,
+):
+    instrumentation = get_worker_instrumentation()
+    with instrumentation.phase("paths"):
+        prices = generate_paths(
+            seeds,
+            turns,
+            starting_price=starting_price,
+            growth_midpoint=growth_midpoint,
+            growth_stddev=growth_stddev,
+            price_model=price_model,
+            returns_source=returns_source,
+            block_length=block_length,
+            sobol_seed=sobol_seed,
+            dtype=path_dtype,
+        )
+    with instrumentation.phase("strategies"):
+        results = evaluate_candidates(
+            prices,
+            salary_schedule(turns, salary, salary_interval),
+            seeds,
+            candidates,
+            starting_money=starting_money,
+        )
+    return results, prices[:, -1]
+
+
+def run_trial_batch_task(task):
+    trial_range, trial_kwargs = task
+    results, _ = run_trial_batch(range_seeds(trial_range), **trial_kwargs)
+    return records_from_batch(results)
+
+
+def run_candidate_batch_task(task):
+    trial_range, trial_kwargs = task
+    results, _ = run_candidate_batch(range_seeds(trial_range), **trial_kwargs)
+    return [records_from_batch(candidate_results) for candidate_results in results]
+
+
+def evaluate_shared_slice(prices, trial_range, candidates, trial_kwargs):
+    seeds = range_seeds(trial_range)
+    with get_worker_instrumentation().phase("strategies"):
+        results = evaluate_candidates(
+            prices,
+            salary_schedule(
+                trial_kwargs["turns"],
+                trial_kwargs["salary"],
+                trial_kwargs["salary_interval"],
+            ),
+            seeds,
+            candidates,
+            starting_money=trial_kwargs["starting_money"],
+        )
+    return [records_from_batch(candidate_results) for candidate_results in results]
+
+
+def run_shared_batch_task(task):
+    # Evaluates candidates on a slice of a SharedPathStore; only the store's
+    # handle and the slice bounds travel with the task, not the paths. The
+    # records are copies, so the store is detached again before returning
+    handle, start, stop, trial_range, candidates, trial_kwargs = task
+    store = SharedPathStore.attach(handle)
+    try:
+        return evaluate_shared_slice(
+            store.array[start:stop], trial_range, candidates, trial_kwargs
+        )
+    finally:
+        store.close()
+
+
+def run_fan_batch_task(task):
+    # Per-turn histograms of price and every strategy's net worth over one
+    # block of trials
+    seeds, grids, trial_kwargs = task
+    turns = trial_kwargs["turns"]
+    instrumentation = get_worker_instrumentation()
+    with instrumentation.phase("paths"):
+        prices = generate_paths(
+            seeds,
+            turns,
+            starting_price=trial_kwargs["starting_price"],
+            growth_midpoint=trial_kwargs["growth_midpoint"],
+            growth_stddev=trial_kwargs["growth_stddev"],
+            price_model=trial_kwargs.get("price_model", "gbm"),
+            returns_source=trial_kwargs.get("returns_source"),
+            block_length=trial_kwargs.get("block_length", 1),
+        )
+    histograms = {name: TurnHistograms(turns, **grid) for name, grid in grids.items()}
+    with instrumentation.phase("strategies"):
+        histograms[FAN_PRICE].add(prices)
+        schedule = salary_schedule(
+            turns, trial_kwargs["salary"], trial_kwargs["salary_interval"]
+        )
+        masks = {
+            BuyRegularly.name: None,
+            BuyDipThreshold.name: dip_threshold_mask(
+                prices, trial_kwargs["dip_threshold"], trial_kwargs["dip_window"]
+            ),
+            NeverBuy.name: np.zeros(prices.shape, dtype=bool),
+        }
+        net_worths = np.empty((turns, len(seeds)))
+        for name, mask in masks.items():
+            run_purchases(
+                prices,
+                schedule,
+                starting_money=trial_kwargs["starting_money"],
+                buy_mask=mask,
+                net_worths=net_worths,
+            )
+            histograms[name].add(net_worths.T)
+    return histograms
+
+
+def new_root_seed():
+    # Fresh entropy for a run that wasn't given a root seed. Every trial in the
+    # run derives from this one root (see trial_seeds).
+    return int(np.random.SeedSequence().entropy)
+
+
+def _mix64(x):
+    # SplitMix64's finalizer: a bijection on uint64 that scatters consecutive
+    # inputs across the whole range
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def trial_seeds(root_seed, first_trial, num_trials):
+    # Seeds of trials first_trial .. first_trial + num_trials - 1 of a run.
+    # The root is hashed once through SeedSequence, then trial i's seed is
+    # SplitMix64 of the root key stepped i times, so a range of trials always
+    # gets the same seeds however the run is split up, in one vectorized pass.
+    # Seeds stay plain ints that run_trial(seed=...) replays. Distinct trials
+    # get distinct mixed states, but the top bit is dropped to fit an int64,
+    # so two of n trials share a seed with probability about n**2 / 2**64.
+    key = np.random.SeedSequence(root_seed).generate_state(1, np.uint64)[0]
+    trials = np.arange(first_trial, first_trial + num_trials, dtype=np.uint64)
+    state = key + (trials + np.uint64(1)) * np.uint64(0x9E3779B97F4A7C15)
+    return (_mix64(state) >> np.uint64(1)).astype(np.int64)
+
+
+def draw_seeds(num_trials, root_seed=None, first_trial=0, sampling="random"):
+    if sampling not in SAMPLING_METHODS:
+        raise ValueError(
+            f"Unknown sampling method {sampling!r}, expected one of {SAMPLING_METHODS}"
+        )
+    if sampling == "sobol":
+        # Trials are Sobol points, picked out by index (see sobol_normals)
+        return np.arange(first_trial, first_trial + num_trials, dtype=np.int64)
+    if root_seed is None:
+        root_seed = new_root_seed()
+    if sampling == "random":
+        return trial_seeds(root_seed, first_trial, num_trials)
+
+    # Each odd trial is the antithetic twin of the even one before it
+    trials = np.arange(first_trial, first_trial + num_trials)
+    first_pair = first_trial - first_trial % 2
+    pair_seeds = trial_seeds(
+        root_seed, first_pair, first_trial + num_trials - first_pair
+    )
+    seeds = pair_seeds[trials - trials % 2 - first_pair]
+    return np.where(trials % 2 == 1, ~seeds, seeds)
+
+
+def sampling_root(trial_kwargs, root_seed=None):
+    # (root seed, sampling method) for a run, with the sampling method in
+    # trial_kwargs swapped for what the path generators need to follow it
+    sampling = trial_kwargs.pop("sampling", "random")
+    if sampling not in SAMPLING_METHODS:
+        raise ValueError(
+            f"Unknown sampling method {sampling!r}, expected one of {SAMPLING_METHODS}"
+        )
+    if sampling != "random" and trial_kwargs.get("price_model") == "bootstrap":
+        raise ValueError(f"{sampling} sampling needs a normal price model")
+    if root_seed is None:
+        root_seed = new_root_seed()
+    if sampling == "sobol":
+        # Every chunk has to draw from the same scrambles
+        trial_kwargs["sobol_seed"] = root_seed
+    return root_seed, sampling
+
+
+def iter_trial_ranges(num_trials, executor, root_seed, sampling, first_trial=0):
+    # The trial range of each chunk, made as it is handed out. A range is
+    # (root_seed, first_trial, num_trials, sampling), which is all a worker
+    # needs to draw the chunk's seeds itself, so neither the seeds nor the
+    # tasks of a whole run are ever held at once.
+    for start, count in executor.ranges(num_trials, start=first_trial):
+        yield root_seed, start, count, sampling
+
+
+def range_seeds(trial_range):
+    root_seed, first_trial, num_trials, sampling = trial_range
+    return draw_seeds(
+        num_trials, root_seed=root_seed, first_trial=first_trial, sampling=sampling
+    )
+
+
+def _drop_trial_only_kwargs(trial_kwargs):
+    # Per-turn printing and charts only exist on the run_trial path
+    for key in _REPORTING_KWARGS:
+        trial_kwargs.pop(key, None)
+
+
+def preload_returns(trial_kwargs):
+    # Load bootstrap returns before any work is handed out, so forked workers
+    # share the parent's copy instead of each loading their own
+    if trial_kwargs.get("price_model") == "bootstrap":
+        load_log_returns(trial_kwargs.get("returns_source"))
+
+
+def iter_trial_chunks(
+    num_trials,
+    executor,
+    vectorized=False,
+    root_seed=None,
+    first_trial=0,
+    instrumentation=NULL_INSTRUMENTATION,
+    **trial_kwargs,
+):
+    preload_returns(trial_kwargs)
+    root_seed, sampling = sampling_root(trial_kwargs, root_seed=root_seed)
+
+    if vectorized:
+        _drop_trial_only_kwargs(trial_kwargs)
+        task = run_trial_batch_task
+    elif any(key in trial_kwargs for key in _VECTORIZED_KWARGS):
+        # run_trial already streams each path a block at a time, and has no
+        # trend buyer
+        raise ValueError(f"{', '.join(_VECTORIZED_KWARGS)} need vectorized=True")
+    else:
+        task = run_trial_chunk
+
+    return instrumentation.imap(
+        executor,
+        task,
+        (
+            (trial_range, trial_kwargs)
+            for trial_range in iter_trial_ranges(
+                num_trials, executor, root_seed, sampling, first_trial=first_trial
+            )
+        ),
+        trial_count=lambda task: task[0][2],
+        turns=trial_kwargs["turns"],
+    )
+
+
+def check_candidate_kwargs(trial_kwargs):
+    # Candidates share whole paths, and only the dip buyer is evaluated for
+    # each, so there is no streaming and no trend buyer
+    if "time_block" in trial_kwargs:
+        raise ValueError("time_block can't be used with shared paths")
+    if trial_kwargs.get("trend_length") is not None:
+        raise ValueError("trend_length can't be used with shared paths")
+
+
+def iter_candidate_chunks(
+    num_trials,
+    candidates,
+    executor,
+    root_seed=None,
+    first_trial=0,
+    instrumentation=NULL_INSTRUMENTATION,
+    **trial_kwargs,
+):
+    # Every (dip_threshold, dip_window) candidate is evaluated against the same
+    # seeded paths, so each path is generated once no matter how many
+    # candidates there are. Each chunk is a list with one records array per
+    # candidate.
+    check_candidate_kwargs(trial_kwargs)
+    _drop_trial_only_kwargs(trial_kwargs)
+    preload_returns(trial_kwargs)
+    root_seed, sampling = sampling_root(trial_kwargs, root_seed=root_seed)
+    trial_kwargs["candidates"] = candidates
+
+    return instrumentation.imap(
+        executor,
+        run_candidate_batch_task,
+        (
+            (trial_range, trial_kwargs)
+            for trial_range in iter_trial_ranges(
+                num_trials, executor, root_seed, sampling, first_trial=first_trial
+            )
+        ),
+        trial_count=lambda task: task[0][2] * len(candidates),
+        turns=trial_kwargs["turns"],
+    )
+
+
+def iter_shared_chunks(
+    num_trials,
+    candidates,
+    executor,
+    root_seed=None,
+    first_trial=0,
+    instrumentation=NULL_INSTRUMENTATION,
+    **trial_kwargs,
+):
+    # Like iter_candidate_chunks, but the parent generates every path once
+    # into shared memory and workers read their trials from it in place. The
+    # store is released once the last chunk has been consumed. With a
+    # path_dtype the store holds the paths in that type.
+    check_candidate_kwargs(trial_kwargs)
+    _drop_trial_only_kwargs(trial_kwargs)
+    root_seed, sampling = sampling_root(trial_kwargs, root_seed=root_seed)
+    path_dtype = trial_kwargs.pop("path_dtype", None) or np.float64
+    turns = trial_kwargs["turns"]
+    path_kwargs = {
+        key: trial_kwargs[key]
+        for key in inspect.signature(generate_paths).parameters
+        if key in trial_kwargs and key != "turns"
+    }
+
+    def iter_slices():
+        # (start, stop, trial_range) of each chunk within the store
+        for trial_range in iter_trial_ranges(
+            num_trials, executor, root_seed, sampling, first_trial=first_trial
+        ):
+            start = trial_range[1] - first_trial
+            yield start, start + trial_range[2], trial_range
+
+    # Forked before the store exists, so the only mappings workers hold are
+    # the ones they attach and close per task
+    executor.start()
+    with SharedPathStore((num_trials, turns), dtype=path_dtype) as store:
+        with instrumentation.phase("paths"):
+            for start, stop, trial_range in iter_slices():
+                store.array[start:stop] = generate_paths(
+                    range_seeds(trial_range), turns, **path_kwargs
+                )
+
+        yield from instrumentation.imap(
+            executor,
+            run_shared_batch_task,
+            (
+                (store.handle, start, stop, trial_range, candidates, trial_kwargs)
+                for start, stop, trial_range in iter_slices()
+            ),
+            trial_count=lambda task: task[3][2] * len(candidates),
+            turns=turns,
+        )
+
+
+def get_seed_name(sampling="random"):
+    # What a record's `seed` is, for table headings. A Sobol trial's is its
+    # index, replayed with run_trial(seed=index, sobol_seed=root_seed).
+    return "Sobol Index" if sampling == "sobol" else "Seed"
+
+
+def new_aggregator(starting_price, streaming=False):
+    if streaming:
+        return StreamingAggregator(starting_price)
+    return ExactAggregator(starting_price)
+
+
+def aggregate_chunks(
+    chunks, starting_price, streaming=False, instrumentation=NULL_INSTRUMENTATION
+):
+    aggregator = new_aggregator(starting_price, streaming=streaming)
+    for records in chunks:
+        with instrumentation.phase("aggregation"):
+            aggregator.add(records)
+    return aggregator
+
+
+def print_thresholds_headline(
+    num_trials, turns, dip_thresholds, dip_window, growth_midpoint, growth_stddev
 ):
     print(
         dedent(
@@ -134,9 +724,136 @@ def run_many_thresholds(
         )
     )
 
-    results_table = prettytable.PrettyTable()
+
+def collect_thresholds(
+    num_trials,
+    dip_thresholds,
+    dip_window,
+    executor,
+    vectorized=False,
+    common_paths=False,
+    shared_memory=False,
+    streaming=False,
+    root_seed=None,
+    first_trial=0,
+    instrumentation=NULL_INSTRUMENTATION,
+    **trial_kwargs,
+):
+    # One aggregator per threshold, plus per-threshold stats of the paired
+    # difference against the first threshold when paths are common
+    starting_price = trial_kwargs["starting_price"]
+    if not common_paths:
+        aggregators = [
+            aggregate_chunks(
+                iter_trial_chunks(
+                    num_trials,
+                    executor,
+                    vectorized=vectorized,
+                    root_seed=root_seed,
+                    first_trial=first_trial,
+                    instrumentation=instrumentation,
+                    dip_threshold=dip_threshold,
+                    dip_window=dip_window,
+                    **trial_kwargs,
+                ),
+                starting_price,
+                streaming=streaming,
+                instrumentation=instrumentation,
+            )
+            for dip_threshold in dip_thresholds
+        ]
+        return aggregators, None
+
+    aggregators = [
+        new_aggregator(starting_price, streaming=streaming) for _ in dip_thresholds
+    ]
+    # Same paths for every threshold, so the per-trial differences cancel
+    # most of the path noise
+    difference_stats = [RunningStats() for _ in dip_thresholds]
+    candidates = [(dip_threshold, dip_window) for dip_threshold in dip_thresholds]
+    iter_chunks = iter_shared_chunks if shared_memory else iter_candidate_chunks
+    for chunk in iter_chunks(
+        num_trials,
+        candidates,
+        executor,
+        root_seed=root_seed,
+        first_trial=first_trial,
+        instrumentation=instrumentation,
+        **trial_kwargs,
+    ):
+        with instrumentation.phase("aggregation"):
+            add_threshold_chunk(aggregators, difference_stats, chunk)
+    return aggregators, difference_stats
+
+
+def collect_checkpointed_thresholds(
+    checkpoint,
+    num_trials,
+    dip_thresholds,
+    dip_window,
+    executor,
+    batch_trials=10000,
+    common_paths=False,
+    streaming=False,
+    instrumentation=NULL_INSTRUMENTATION,
+    **collect_kwargs,
+):
+    # Same result as collect_thresholds, but trials run in batches of
+    # `batch_trials` and each finished batch is saved to the checkpoint.
+    # Batches already in the checkpoint are read back instead of run again.
+    starting_price = collect_kwargs["starting_price"]
+    aggregators = [
+        new_aggregator(starting_price, streaming=streaming) for _ in dip_thresholds
+    ]
+    difference_stats = (
+        [RunningStats() for _ in dip_thresholds] if common_paths else None
+    )
+    for first_trial in range(0, num_trials, batch_trials):
+        if checkpoint.has_chunk(first_trial):
+            with instrumentation.phase("checkpoint"):
+                chunk = checkpoint.load_chunk(first_trial)
+        else:
+            batch_aggregators, _ = collect_thresholds(
+                min(batch_trials, num_trials - first_trial),
+                dip_thresholds,
+                dip_window,
+                executor,
+                common_paths=common_paths,
+                root_seed=checkpoint.root_seed,
+                first_trial=first_trial,
+                instrumentation=instrumentation,
+                **collect_kwargs,
+            )
+            chunk = [aggregator.get_records() for aggregator in batch_aggregators]
+            with instrumentation.phase("checkpoint"):
+                checkpoint.save_chunk(first_trial, chunk)
+
+        with instrumentation.phase("aggregation"):
+            if common_paths:
+                add_threshold_chunk(aggregators, difference_stats, chunk)
+            else:
+                for aggregator, records in zip(aggregators, chunk):
+                    aggregator.add(records)
+    return aggregators, difference_stats
+
+
+def add_threshold_chunk(aggregators, difference_stats, chunk):
+    # chunk holds one records array per threshold, all on the same paths
+    baseline_ratios = net_worth_ratios(chunk[0])
+    for aggregator, stats, records in zip(aggregators, difference_stats, chunk):
+        aggregator.add(records)
+        stats.add(net_worth_ratios(records) - baseline_ratios)
+
+
+def thresholds_table(
+    dip_thresholds,
+    aggregators,
+    difference_stats=None,
+    include_extras=False,
+    seed_name="Seed",
+):
     if include_extras:
-        results_table.field_names = [
+        field_names = [
             "Threshold",
             "Net Worth (Mean, 95% CI)",
             "Net Worth (P50)",
@@ -148,129 +865,170 @@ def run_many_thresholds(
             "Final Price (P50)",
             "Price Paid (P50)",
             "Days with Buy (P50)",
-            "Seed (P50)",
+            f"{seed_name} (P50)",
         ]
     else:
-        results_table.field_names = [
+        field_names = [
             "Threshold",
             "Net Worth (Mean, 95% CI)",
             "Net Worth (P50)",
             "Price Paid (P50)",
             "Days with Buy (P50)",
-            "Seed (P50)",
+            f"{seed_name} (P50)",
         ]
+    if difference_stats is not None:
+        field_names.append(f"Net Worth vs {dip_thresholds[0]} (Paired, 95% CI)")
+
+    results_table = prettytable.PrettyTable()
+    results_table.field_names = field_names
     results_table.align = "r"
     results_table.vrules = prettytable.FRAME
 
-    for dip_threshold in dip_thresholds:
-        strategy_map = defaultdict(list)
-
-        with Pool(cpu_count()) as pool:
-            trials = pool.map(
-                run_trial_map_wrapper,
-                [
-                    dict(
-                        turns=turns,
-                        starting_money=starting_money,
-                        salary=salary,
-                        salary_interval=salary_interval,
-                        starting_price=starting_price,
-                        growth_midpoint=growth_midpoint,
-                        growth_stddev=growth_stddev,
-                        dip_threshold=dip_threshold,
-                        dip_window=dip_window,
-                        **kwargs,
-                    )
-                ]
-                * num_trials,
-            )
-
-        for trial in trials:
-            for s in trial[0]:
-                strategy_map[s.name].append(s)
-        prices = [trial[1] for trial in trials]
+    for i, (dip_threshold, aggregator) in enumerate(zip(dip_thresholds, aggregators)):
+        median = aggregator.get_record_at(50)
 
-        strategy_pairs = sorted(
-            zip(strategy_map[BuyRegularly.name], strategy_map[BuyDipThreshold.name]),
-            key=lambda pair: pair[0].get_net_worth() / pair[1].get_net_worth()
-            if pair[1].get_net_worth() > 0
-            else math.inf,
+        ratio_summary = (
+            f"{aggregator.get_mean('ratio'):.3f}x ± {aggregator.get_ci('ratio'):.3f}"
         )
+        if include_extras:
+            row = [
+                dip_threshold,
+                ratio_summary,
+                f"{net_worth_ratios(median):.3f}x",
+                f"{aggregator.get_mean('winning_ratio'):.3f}x",
+                f"{aggregator.get_median('winning_ratio'):.3f}x",
+                f"{aggregator.get_mean('losing_ratio'):.3f}x",
+                f"{aggregator.get_median('losing_ratio'):.3f}x",
+                f"${aggregator.get_mean('price'):,.2f}",
+                f"${aggregator.get_median('price'):,.2f}",
+                f"{aggregator.get_median('avg_price_ratio'):.2f}x",
+                f"{aggregator.get_median('buy_count_ratio'):.2f}x",
+                f"{median['seed']:d}",
+            ]
+        else:
+            row = [
+                dip_threshold,
+                ratio_summary,
+                f"{net_worth_ratios(median):.3f}x",
+                f"{aggregator.get_median('avg_price_ratio'):.2f}x",
+                f"{aggregator.get_median('buy_count_ratio'):.2f}x",
+                f"{median['seed']:d}",
+            ]
 
-        pair_50pct = strategy_pairs[len(strategy_pairs) // 2]
+        if difference_stats is not None:
+            stats = difference_stats[i]
+            row.append(f"{stats.get_mean():+.3f}x ± {stats.get_ci():.3f}")
 
-        ratios = [
-            r.get_net_worth() / d.get_net_worth() if d.get_net_worth() > 0 else math.inf
-            for r, d in strategy_pairs
-        ]
+        results_table.add_row(row)
 
-        winning_ratios = [
-            (
-                r.get_net_worth() / d.get_net_worth()
-                if d.get_net_worth() > 0
-                else math.inf
-            )
-            for r, d in strategy_pairs
-            if r.last_price >= starting_price
-        ]
-
-        losing_ratios = [
-            (
-                r.get_net_worth() / d.get_net_worth()
-                if d.get_net_worth() > 0
-                else math.inf
-            )
-            for r, d in strategy_pairs
-            if r.last_price < starting_price
-        ]
+    return results_table
 
-        mean_ratio = np.mean(ratios)
-        ratio_ci = st.norm.ppf(0.95) * st.sem(ratios)
 
-        avg_price_ratios = []
-        for r, d in strategy_pairs:
-            if d.get_avg_price() > 0:
-                avg_price_ratios.append(r.get_avg_price() / d.get_avg_price())
-            else:
-                avg_price_ratios.append(math.inf)
+@with_executor
+def run_many_thresholds(
+    num_trials,
+    turns,
+    dip_thresholds,
+    dip_window=30,
+    growth_midpoint=0.0006,
+    growth_stddev=0.0094,
+    starting_price=100,
+    starting_money=0,
+    salary=100,
+    salary_interval=1,
+    include_extras=False,
+    vectorized=False,
+    common_paths=False,
+    shared_memory=False,
+    streaming=False,
+    root_seed=None,
+    checkpoint=None,
+    resume=False,
+    checkpoint_trials=10000,
+    instrument=False,
+    executor=None,
+    **kwargs,
+):
+    # Paths generated centrally into shared memory are the same for every
+    # threshold, so they are always compared on common paths. With a
+    # root_seed, every trial's seed is fixed by its index (see draw_seeds),
+    # so a run can be repeated exactly or split up with shards.py.
+    #
+    # With a `checkpoint` directory, finished batches of `checkpoint_trials`
+    # trials are saved as they complete, and resume=True continues a run that
+    # stopped part way (or just re-reads a finished one).
+    #
+    # With instrument=True, returns a report of where the run's time went
+    # (see instrumentation.py); otherwise returns None.
+    instrumentation = Instrumentation() if instrument else NULL_INSTRUMENTATION
+    common_paths = common_paths or shared_memory
+    print_thresholds_headline(
+        num_trials, turns, dip_thresholds, dip_window, growth_midpoint, growth_stddev
+    )
 
-        buy_count_ratios = []
-        for r, d in strategy_pairs:
-            if d.buy_count > 0:
-                buy_count_ratios.append(r.buy_count / d.buy_count)
-            else:
-                buy_count_ratios.append(math.inf)
+    trial_kwargs = dict(
+        turns=turns,
+        starting_money=starting_money,
+        salary=salary,
+        salary_interval=salary_interval,
+        starting_price=starting_price,
+        growth_midpoint=growth_midpoint,
+        growth_stddev=growth_stddev,
+        **kwargs,
+    )
+    collect_kwargs = dict(
+        vectorized=vectorized,
+        common_paths=common_paths,
+        shared_memory=shared_memory,
+        streaming=streaming,
+        instrumentation=instrumentation,
+        **trial_kwargs,
+    )
+    if checkpoint is None:
+        aggregators, difference_stats = collect_thresholds(
+            num_trials,
+            dip_thresholds,
+            dip_window,
+            executor,
+            root_seed=root_seed,
+            **collect_kwargs,
+        )
+    else:
+        checkpoint = Checkpoint(
+            checkpoint,
+            dict(
+                driver="run_many_thresholds",
+                num_trials=num_trials,
+                dip_thresholds=dip_thresholds,
+                dip_window=dip_window,
+                common_paths=common_paths,
+                checkpoint_trials=checkpoint_trials,
+                trial_kwargs=evaluation_kwargs(trial_kwargs),
+            ),
+            root_seed=root_seed,
+            resume=resume,
+        )
+        aggregators, difference_stats = collect_checkpointed_thresholds(
+            checkpoint,
+            num_trials,
+            dip_thresholds,
+            dip_window,
+            executor,
+            batch_trials=checkpoint_trials,
+            **collect_kwargs,
+        )
 
-        if include_extras:
-            results_table.add_row(
-                [
-                    dip_threshold,
-                    f"{mean_ratio:.3f}x ± {ratio_ci:.3f}",
-                    f"{pair_50pct[0].get_net_worth() / pair_50pct[1].get_net_worth():.3f}x",
-                    f"{np.mean(winning_ratios):.3f}x",
-                    f"{np.median(winning_ratios):.3f}x",
-                    f"{np.mean(losing_ratios):.3f}x",
-                    f"{np.median(losing_ratios):.3f}x",
-                    f"${np.mean(prices):,.2f}",
-                    f"${np.median(prices):,.2f}",
-                    f"{np.median(avg_price_ratios):.2f}x",
-                    f"{np.median(buy_count_ratios):.2f}x",
-                    f"{pair_50pct[0].seed:d}",
-                ]
-            )
-        else:
-            results_table.add_row(
-                [
-                    dip_threshold,
-                    f"{mean_ratio:.3f}x ± {ratio_ci:.3f}",
-                    f"{pair_50pct[0].get_net_worth() / pair_50pct[1].get_net_worth():.3f}x",
-                    f"{np.median(avg_price_ratios):.2f}x",
-                    f"{np.median(buy_count_ratios):.2f}x",
-                    f"{pair_50pct[0].seed:d}",
-                ]
+    with instrumentation.phase("table"):
+        print(
+            thresholds_table(
+                dip_thresholds,
+                aggregators,
+                difference_stats=difference_stats,
+                include_extras=include_extras,
+                seed_name=get_seed_name(kwargs.get("sampling")),
             )
-
-    print(results_table)
+        )
+    return instrumentation.get_report()
 
 
 ########################################################
@@ -278,6 +1036,33 @@ def run_many_thresholds(
 ########################################################
 
 
+def get_controls(
+    records,
+    turns,
+    starting_price,
+    growth_midpoint,
+    salary,
+    salary_interval,
+    price_model="gbm",
+):
+    # Per-trial values whose means are known exactly for GBM paths, as
+    # get_estimates takes them: the final price, whose mean is
+    # S0 * e^(μ * turns), and the dca_value (see vectorized.dca_values), whose
+    # salary paid on turn t grows by e^(μ * (turns - 1 - t)) on average
+    if price_model != "gbm":
+        raise ValueError("Control variates need the gbm price model")
+    schedule = salary_schedule(turns, salary, salary_interval)
+    growth = np.exp(growth_midpoint * np.arange(turns - 1, -1, -1))
+    return {
+        "final price": (
+            records["reg"]["last_price"],
+            starting_price * math.exp(growth_midpoint * turns),
+        ),
+        "dca value": (records["dca_value"], (schedule * growth).sum() / schedule.sum()),
+    }
+
+
+@with_executor
 def run_many_trials(
     trials,
     turns=365 * 3,
@@ -291,8 +1076,34 @@ def run_many_trials(
     growth_stddev=0.0094,
     dip_threshold=0.95,
     dip_window=30,
+    vectorized=False,
+    shared_memory=False,
+    streaming=False,
+    root_seed=None,
+    instrument=False,
+    chart_dir=None,
+    chart_format="png",
+    sampling="random",
+    control_variates=False,
+    executor=None,
     **kwargs,
 ):
+    # With instrument=True, the instrumentation report (see
+    # instrumentation.py) is returned after the mean ratio and its CI. With a
+    # chart_dir, the trial reported at each percentile is re-run and charted
+    # there.
+    #
+    # sampling="antithetic" or "sobol" and control_variates=True reduce the
+    # variance of the mean net worth ratio (see get_estimates), and the mean
+    # and CI returned are the reduced ones.
+    variance_reduction = sampling != "random" or control_variates
+    if variance_reduction and streaming:
+        raise ValueError("Variance reduction needs every trial, so streaming=False")
+    # Drawn here so that the trials can be re-run for charts, which Sobol
+    # trials need their root for
+    root_seed = root_seed if root_seed is not None else new_root_seed()
+    seed_name = get_seed_name(sampling)
+    instrumentation = Instrumentation() if instrument else NULL_INSTRUMENTATION
     if show_headline:
         print(
             dedent(
@@ -306,56 +1117,130 @@ def run_many_trials(
             )
         )
 
-    strategy_map = defaultdict(list)
-
-    with Pool(cpu_count()) as pool:
-        trials = pool.map(
-            run_trial_map_wrapper,
-            [
-                dict(
-                    turns=turns,
-                    starting_money=starting_money,
-                    salary=salary,
-                    salary_interval=salary_interval,
-                    starting_price=starting_price,
-                    growth_midpoint=growth_midpoint,
-                    growth_stddev=growth_stddev,
-                    dip_threshold=dip_threshold,
-                    dip_window=dip_window,
-                    **kwargs,
-                )
-            ]
-            * trials,
+    trial_kwargs = dict(
+        turns=turns,
+        starting_money=starting_money,
+        salary=salary,
+        salary_interval=salary_interval,
+        starting_price=starting_price,
+        growth_midpoint=growth_midpoint,
+        growth_stddev=growth_stddev,
+        **kwargs,
+    )
+    if shared_memory:
+        chunks = (
+            records
+            for records, in iter_shared_chunks(
+                trials,
+                [(dip_threshold, dip_window)],
+                executor,
+                root_seed=root_seed,
+                instrumentation=instrumentation,
+                sampling=sampling,
+                **trial_kwargs,
+            )
         )
-
-    for trial in trials:
-        for s in trial[0]:
-            strategy_map[s.name].append(s)
-    prices = [trial[1] for trial in trials]
-
-    strategy_pairs = sorted(
-        zip(strategy_map[BuyRegularly.name], strategy_map[BuyDipThreshold.name]),
-        key=lambda pair: pair[0].get_net_worth() / pair[1].get_net_worth()
-        if pair[1].get_net_worth() > 0
-        else math.inf,
+    else:
+        chunks = iter_trial_chunks(
+            trials,
+            executor,
+            vectorized=vectorized,
+            root_seed=root_seed,
+            instrumentation=instrumentation,
+            sampling=sampling,
+            dip_threshold=dip_threshold,
+            dip_window=dip_window,
+            **trial_kwargs,
+        )
+    aggregator = aggregate_chunks(
+        chunks, starting_price, streaming=streaming, instrumentation=instrumentation
     )
 
-    pair_5pct = strategy_pairs[len(strategy_pairs) // 20]
-    pair_25pct = strategy_pairs[len(strategy_pairs) // 4]
-    pair_50pct = strategy_pairs[len(strategy_pairs) // 2]
-    pair_75pct = strategy_pairs[(len(strategy_pairs) // 4) * 3]
-    pair_95pct = strategy_pairs[(len(strategy_pairs) // 20) * 19]
-
-    ratios = [
-        r.get_net_worth() / d.get_net_worth() if d.get_net_worth() > 0 else math.inf
-        for r, d in strategy_pairs
-    ]
-
-    mean_ratio = np.mean(ratios)
-    ratio_ci = st.norm.ppf(0.95) * st.sem(ratios)
+    # One representative trial per percentile of the net worth ratio
+    percentiles = (5, 25, 50, 75, 95)
+    percentile_records = np.array(
+        [aggregator.get_record_at(p) for p in percentiles], dtype=TRIAL_DTYPE
+    )
 
-    mean_price = np.mean(prices)
-    price_ci = st.norm.ppf(0.95) * st.sem(prices)
+    if chart_dir is not None:
+        os.makedirs(chart_dir, exist_ok=True)
+        # run_trial replays the trial from its seed and takes none of the
+        # vectorized-only arguments
+        chart_kwargs = {
+            key: value
+            for key, value in trial_kwargs.items()
+            if key not in _VECTORIZED_KWARGS
+        }
+        chart_kwargs.update(dip_threshold=dip_threshold, dip_window=dip_window)
+        prefix = "seed"
+        if sampling == "sobol":
+            chart_kwargs["sobol_seed"] = root_seed
+            prefix = "sobol"
+        tasks = [
+            (
+                int(seed),
+                os.path.join(chart_dir, f"p{percent}_{prefix}{seed}.{chart_format}"),
+                chart_kwargs,
+            )
+            for percent, seed in zip(percentiles, percentile_records["seed"])
+        ]
+        for filename in executor.imap(save_trial_chart, tasks):
+            print(f"Wrote {filename}")
+
+    mean_ratio = aggregator.get_mean("ratio")
+    ratio_ci = aggregator.get_ci("ratio")
+
+    mean_price = aggregator.get_mean("price")
+    price_ci = aggregator.get_ci("price")
+
+    if variance_reduction:
+        records = aggregator.get_records()
+        controls = None
+        if control_variates:
+            controls = get_controls(
+                records,
+                turns,
+                starting_price,
+                growth_midpoint,
+                salary,
+                salary_interval,
+                price_model=kwargs.get("price_model", "gbm"),
+            )
+        estimates = get_estimates(records, sampling=sampling, controls=controls)
+        mean_ratio = estimates[-1]["mean"]
+        ratio_ci = estimates[-1]["ci"]
+
+    if show_headline and variance_reduction:
+        estimates_table = prettytable.PrettyTable()
+        estimates_table.field_names = [
+            "Estimator",
+            "Mean Net Worth Ratio (95% Confidence)",
+            "Trials",
+            "Effective Trials",
+            "Efficiency",
+        ]
+        for estimate in estimates:
+            # Approximate sizes come from the spread of a few replicates
+            mark = "~" if estimate["approximate"] else ""
+            estimates_table.add_row(
+                [
+                    estimate["method"],
+                    f"{estimate['mean']:.3f} ± {estimate['ci']:.3f}",
+                    f"{estimate['trials']:,}",
+                    f"{mark}{estimate['effective_trials']:,.0f}",
+                    f"{mark}{estimate['effective_trials'] / estimate['trials']:.1f}x",
+                ]
+            )
+        estimates_table.align = "r"
+        estimates_table.vrules = prettytable.FRAME
+        print(estimates_table)
+        if any(estimate["approximate"] for estimate in estimates):
+            print("~ from the spread of only a few replicate means, so only a guide")
+        if estimates[0]["inf_count"]:
+            print(
+                f"{estimates[0]['inf_count']:,} trials with an infinite ratio "
+                "are left out of every estimate"
+            )
 
     if show_headline:
         print("Results:")
@@ -389,10 +1274,7 @@ def run_many_trials(
             [
                 "Reg vs Dip Ratio",
                 "Net Worth",
-                *map(
-                    lambda p: f"{p[0].get_net_worth() / p[1].get_net_worth():.2f}",
-                    [pair_5pct, pair_25pct, pair_50pct, pair_75pct, pair_95pct],
-                ),
+                *(f"{r:.2f}" for r in net_worth_ratios(percentile_records)),
             ]
         )
 
@@ -400,10 +1282,7 @@ def run_many_trials(
             [
                 "Reg vs Dip Ratio",
                 "Price Paid",
-                *map(
-                    lambda p: f"{p[0].get_avg_price()/p[1].get_avg_price() if p[1].get_avg_price() > 0 else math.inf:,.2f}",
-                    [pair_5pct, pair_25pct, pair_50pct, pair_75pct, pair_95pct],
-                ),
+                *(f"{r:,.2f}" for r in avg_price_ratios(percentile_records)),
             ]
         )
 
@@ -411,10 +1290,7 @@ def run_many_trials(
             [
                 "Reg vs Dip Ratio",
                 "Days with Buy",
-                *map(
-                    lambda p: f"{p[0].buy_count / p[1].buy_count if p[1].buy_count > 0 else math.inf:,.2f}",
-                    [pair_5pct, pair_25pct, pair_50pct, pair_75pct, pair_95pct],
-                ),
+                *(f"{r:,.2f}" for r in buy_count_ratios(percentile_records)),
             ]
         )
 
@@ -422,39 +1298,26 @@ def run_many_trials(
             [
                 "",
                 "% days at peak price",
-                *map(
-                    lambda p: f"{p[0].peak_count / turns:.2%}",
-                    [pair_5pct, pair_25pct, pair_50pct, pair_75pct, pair_95pct],
-                ),
+                *(f"{p / turns:.2%}" for p in percentile_records["reg"]["peak_count"]),
             ]
         )
         table.add_row(
             [
                 "",
-                "Seed",
-                *map(
-                    lambda p: p[0].seed,
-                    [pair_5pct, pair_25pct, pair_50pct, pair_75pct, pair_95pct],
-                ),
+                seed_name,
+                *percentile_records["seed"],
             ],
             divider=True,
         )
 
-        for i, strategy_name in enumerate([BuyRegularly.name, BuyDipThreshold.name]):
-            s_5pct = pair_5pct[i]
-            s_25pct = pair_25pct[i]
-            s_50pct = pair_50pct[i]
-            s_75pct = pair_75pct[i]
-            s_95pct = pair_95pct[i]
+        for strategy_name in [BuyRegularly.name, BuyDipThreshold.name]:
+            s = percentile_records[STRATEGY_FIELDS[strategy_name]]
 
             table.add_row(
                 [
                     strategy_name,
                     "Net Worth",
-                    *map(
-                        lambda s: f"{s.get_net_worth():,.2f}",
-                        [s_5pct, s_25pct, s_50pct, s_75pct, s_95pct],
-                    ),
+                    *(f"{nw:,.2f}" for nw in s["net_worth"]),
                 ]
             )
 
@@ -462,10 +1325,7 @@ def run_many_trials(
                 [
                     strategy_name,
                     "Average Price Paid",
-                    *map(
-                        lambda s: f"{s.get_avg_price():,.2f}",
-                        [s_5pct, s_25pct, s_50pct, s_75pct, s_95pct],
-                    ),
+                    *(f"{p:,.2f}" for p in s["avg_price"]),
                 ]
             )
 
@@ -473,10 +1333,7 @@ def run_many_trials(
                 [
                     strategy_name,
                     "Days with Buy",
-                    *map(
-                        lambda s: f"{s.buy_count}",
-                        [s_5pct, s_25pct, s_50pct, s_75pct, s_95pct],
-                    ),
+                    *(f"{c}" for c in s["buy_count"]),
                 ],
                 divider=True,
             )
@@ -493,9 +1350,134 @@ def run_many_trials(
         table.vrules = prettytable.FRAME
         print(table)
 
+    if instrument:
+        return mean_ratio, ratio_ci, instrumentation.get_report()
     return mean_ratio, ratio_ci
 
 
+# Name of the price series in run_fan_chart's results
+FAN_PRICE = "Price"
+FAN_PERCENTILES = (5, 25, 50, 75, 95)
+# The only path options run_fan_batch_task passes on to generate_paths
+_FAN_KWARGS = ("price_model", "returns_source", "block_length")
+
+
+@with_executor
+def run_fan_chart(
+    num_trials,
+    turns=365 * 3,
+    dip_threshold=0.95,
+    dip_window=30,
+    growth_midpoint=0.0006,
+    growth_stddev=0.0094,
+    starting_price=100,
+    starting_money=0,
+    salary=100,
+    salary_interval=1,
+    block_trials=2000,
+    bins=512,
+    root_seed=None,
+    show_chart=None,
+    executor=None,
+    **kwargs,
+):
+    # Per-turn P5 / P25 / P50 / P75 / P95 of the price and of each strategy's
+    # net worth across all trials. Trials are run in blocks of `block_trials`
+    # and folded into per-turn histograms (see TurnHistograms), so memory
+    # depends on the block size, turns and bins but not on num_trials.
+    # Returns {series name: (percentiles, turns) array}. show_chart works as
+    # it does for run_trial: True shows the fan chart, a filename writes it.
+    unsupported = sorted(set(kwargs) - set(_FAN_KWARGS))
+    if unsupported:
+        raise ValueError(f"{', '.join(unsupported)} can't be used with run_fan_chart")
+    print(
+        dedent(
+            f"""
+            Starting {num_trials} trials, each running for {turns} turns, with the following parameters:
+            Asset Growth Midpoint: {growth_midpoint}
+            Asset Growth Stddev: {growth_stddev}
+            Dip Threshold: {dip_threshold}
+            Dip Window: {dip_window}
+        """
+        )
+    )
+    trial_kwargs = dict(
+        turns=turns,
+        starting_money=starting_money,
+        salary=salary,
+        salary_interval=salary_interval,
+        starting_price=starting_price,
+        growth_midpoint=growth_midpoint,
+        growth_stddev=growth_stddev,
+        dip_threshold=dip_threshold,
+        dip_window=dip_window,
+        **kwargs,
+    )
+    preload_returns(trial_kwargs)
+
+    # Net worth is measured against what has been paid in by each turn, and
+    # price against the starting price. Both grids are wide enough that only
+    # extreme tails fall off the ends.
+    paid_in = starting_money + np.cumsum(salary_schedule(turns, salary, salary_interval))
+    net_worth_grid = dict(low=0.01, high=100, bins=bins, scale=np.maximum(paid_in, 1))
+    grids = {
+        FAN_PRICE: dict(
+            low=starting_price / 100, high=starting_price * 1000, bins=bins
+        ),
+        BuyRegularly.name: net_worth_grid,
+        BuyDipThreshold.name: net_worth_grid,
+        NeverBuy.name: net_worth_grid,
+    }
+    histograms = {name: TurnHistograms(turns, **grid) for name, grid in grids.items()}
+
+    # Blocks are handed out a few per worker at a time, so neither seeds nor
+    # finished histograms waiting to be merged pile up
+    first_trials = range(0, num_trials, block_trials)
+    wave = executor.workers * 2
+    for start in range(0, len(first_trials), wave):
+        tasks = [
+            (
+                draw_seeds(
+                    min(block_trials, num_trials - first_trial),
+                    root_seed=root_seed,
+                    first_trial=first_trial,
+                ),
+                grids,
+                trial_kwargs,
+            )
+            for first_trial in first_trials[start : start + wave]
+        ]
+        for block_histograms in executor.imap(run_fan_batch_task, tasks):
+            for name, histogram in block_histograms.items():
+                histograms[name].merge(histogram)
+
+    bands = {
+        name: histogram.get_percentiles(FAN_PERCENTILES)
+        for name, histogram in histograms.items()
+    }
+
+    table = prettytable.PrettyTable()
+    table.field_names = [
+        f"Turn {turns}",
+        *(f"{percent}th Percentile" for percent in FAN_PERCENTILES),
+    ]
+    for name, band in bands.items():
+        table.add_row([name, *(f"{value:,.2f}" for value in band[:, -1])])
+    table.align = "r"
+    table.vrules = prettytable.FRAME
+    print(table)
+
+    if show_chart:
+        chart_fan(
+            bands,
+            FAN_PERCENTILES,
+            price_name=FAN_PRICE,
+            filename=show_chart if isinstance(show_chart, str) else None,
+        )
+    return bands
+
+
+@with_executor
 def optimal_walker(
     growth_midpoint,
     growth_stddev,
@@ -503,27 +1485,115 @@ def optimal_walker(
     starting_window=30,
     starting_trials=1000,
     turns=365 * 3,
+    shared_paths=False,
+    checkpoint=None,
+    resume=False,
+    instrument=False,
+    executor=None,
     **kwargs,
 ):
+    # With a `checkpoint` directory, the walker's position is saved after
+    # every step, and resume=True carries on from the last saved step instead
+    # of starting over. With instrument=True, returns the instrumentation
+    # report for every evaluation the walk made.
+    #
+    # The whole walk draws from one root seed, and each candidate point
+    # carries on from the trials it was last given, so a point evaluated
+    # again (or the current point, re-estimated with shared_paths) always
+    # gets new trials. Without a root_seed of its own, the walk's root is
+    # only used to draw trials: cached evaluations stay keyed as unseeded, so
+    # a later walk can still carry them on.
+    instrumentation = Instrumentation() if instrument else NULL_INSTRUMENTATION
     trials = starting_trials
     dip_threshold = starting_threshold
     dip_window = starting_window
 
     window_max = turns
 
-    mean_ratio, ci = try_params(
-        trials,
-        dip_threshold,
-        dip_window,
-        growth_midpoint=growth_midpoint,
-        growth_stddev=growth_stddev,
-        turns=turns,
-        **kwargs,
-    )
+    state = None
+    if checkpoint is not None:
+        checkpoint = Checkpoint(
+            checkpoint,
+            dict(
+                driver="optimal_walker",
+                growth_midpoint=growth_midpoint,
+                growth_stddev=growth_stddev,
+                starting_threshold=starting_threshold,
+                starting_window=starting_window,
+                starting_trials=starting_trials,
+                turns=turns,
+                shared_paths=shared_paths,
+                trial_kwargs=evaluation_kwargs(kwargs),
+            ),
+            root_seed=kwargs.get("root_seed"),
+            resume=resume,
+        )
+        state = checkpoint.load_state()
+        walk_root_seed = checkpoint.root_seed
+    elif kwargs.get("root_seed") is not None:
+        walk_root_seed = kwargs["root_seed"]
+    else:
+        walk_root_seed = new_root_seed()
+    trial_offsets = {}
+
+    if state is not None:
+        dip_threshold = state["dip_threshold"]
+        dip_window = state["dip_window"]
+        mean_ratio = state["mean_ratio"]
+        ci = state["ci"]
+        step_multiplier = state["step_multiplier"]
+        steps = state["steps"]
+        done = state["done"]
+        trial_offsets = {
+            (threshold, window): next_trial
+            for threshold, window, next_trial in state.get("trial_offsets", [])
+        }
+        print(f"Resuming from step {len(steps)}")
+    else:
+        mean_ratio, ci = try_params(
+            trials,
+            dip_threshold,
+            dip_window,
+            growth_midpoint=growth_midpoint,
+            growth_stddev=growth_stddev,
+            turns=turns,
+            default_root_seed=walk_root_seed,
+            trial_offsets=trial_offsets,
+            instrumentation=instrumentation,
+            executor=executor,
+            **kwargs,
+        )
 
-    step_multiplier = 1
+        step_multiplier = 1
+        steps = []
+        done = False
+
+    def save_state(moved=True):
+        # `steps` keeps every point the walker has stood on, as output
+        if checkpoint is None:
+            return
+        if moved:
+            steps.append([dip_threshold, dip_window, mean_ratio, ci])
+        checkpoint.save_state(
+            dict(
+                dip_threshold=dip_threshold,
+                dip_window=dip_window,
+                mean_ratio=mean_ratio,
+                ci=ci,
+                step_multiplier=step_multiplier,
+                steps=steps,
+                done=done,
+                trial_offsets=[
+                    [threshold, window, next_trial]
+                    for (threshold, window), next_trial in trial_offsets.items()
+                ],
+            )
+        )
 
-    while True:
+    if state is None:
+        save_state()
+
+    while not done:
         if 0.99 < mean_ratio < 1.01:
             print("Found tipping point")
             break
@@ -537,48 +1607,53 @@ def optimal_walker(
         )
 
         dip_t_up = min(1 - ((1 - dip_threshold) / (2 * step_multiplier)), 0.99)
-        dip_t_up_ratio, dip_t_up_ci = try_params(
-            trials,
-            dip_t_up,
-            dip_window,
-            growth_midpoint=growth_midpoint,
-            growth_stddev=growth_stddev,
-            turns=turns,
-            **kwargs,
-        )
-
         dip_t_down = max(1 - ((1 - dip_threshold) * (1 + (1 / step_multiplier))), 0)
-        dip_t_down_ratio, dip_t_down_ci = try_params(
-            trials,
-            dip_t_down,
-            dip_window,
-            growth_midpoint=growth_midpoint,
-            growth_stddev=growth_stddev,
-            turns=turns,
-            **kwargs,
-        )
-
         dip_w_up = min(math.floor(dip_window * (1 + (1 / step_multiplier))), window_max)
-        dip_w_up_ratio, dip_w_up_ci = try_params(
-            trials,
-            dip_threshold,
-            dip_w_up,
-            growth_midpoint=growth_midpoint,
-            growth_stddev=growth_stddev,
-            turns=turns,
-            **kwargs,
-        )
-
         dip_w_down = max(dip_window // (1 + (1 / step_multiplier)), 2)
-        dip_w_down_ratio, dip_w_down_ci = try_params(
-            trials,
-            dip_threshold,
-            dip_w_down,
-            growth_midpoint=growth_midpoint,
-            growth_stddev=growth_stddev,
-            turns=turns,
-            **kwargs,
-        )
+
+        neighbours = [
+            (dip_t_up, dip_window),
+            (dip_t_down, dip_window),
+            (dip_threshold, dip_w_up),
+            (dip_threshold, dip_w_down),
+        ]
+        if shared_paths:
+            # Re-estimate the current point alongside its neighbours so that
+            # every ratio in this step comes from the same paths
+            (mean_ratio, ci), *estimates = try_candidates(
+                trials,
+                [(dip_threshold, dip_window), *neighbours],
+                growth_midpoint=growth_midpoint,
+                growth_stddev=growth_stddev,
+                turns=turns,
+                trial_offsets=trial_offsets,
+                instrumentation=instrumentation,
+                executor=executor,
+                **dict(kwargs, root_seed=walk_root_seed),
+            )
+        else:
+            estimates = [
+                try_params(
+                    trials,
+                    candidate_threshold,
+                    candidate_window,
+                    growth_midpoint=growth_midpoint,
+                    growth_stddev=growth_stddev,
+                    turns=turns,
+                    default_root_seed=walk_root_seed,
+                    trial_offsets=trial_offsets,
+                    instrumentation=instrumentation,
+                    executor=executor,
+                    **kwargs,
+                )
+                for candidate_threshold, candidate_window in neighbours
+            ]
+        (
+            (dip_t_up_ratio, dip_t_up_ci),
+            (dip_t_down_ratio, dip_t_down_ci),
+            (dip_w_up_ratio, dip_w_up_ci),
+            (dip_w_down_ratio, dip_w_down_ci),
+        ) = estimates
 
         best_option = "current"
         best_ratio = mean_ratio
@@ -621,6 +1696,11 @@ def optimal_walker(
             step_multiplier *= 2
 
         direction = 1 if mean_ratio < 1 else -1
+        save_state()
+
+    if not done:
+        done = True
+        save_state(moved=False)
 
     print(
         dedent(
@@ -632,24 +1712,316 @@ def optimal_walker(
         """
         )
     )
+    return instrumentation.get_report()
+
+
+class SequentialResult:
+    def __init__(self, stats, batches, elapsed, root_seed=None, next_trial=0):
+        self.stats = stats
+        self.batches = batches
+        self.elapsed = elapsed
+        # Where the sample's trials came from, to extend it with new ones
+        self.root_seed = root_seed
+        self.next_trial = next_trial
+
+    @property
+    def mean_ratio(self):
+        return self.stats.get_mean()
+
+    @property
+    def confidence_interval(self):
+        return self.stats.get_ci()
+
+    @property
+    def trials(self):
+        return self.stats.count + self.stats.inf_count
+
+    def __repr__(self) -> str:
+        return (
+            f"{get_sample_summary(self.stats)} from "
+            f"{self.trials} trials in {self.batches} batches ({self.elapsed:.1f}s)"
+        )
 
 
-def try_params(trials, dip_threshold, dip_window, **kwargs):
-    # Temp starting variables that will fail first iteration of while loop
-    mean_ratio = 0
-    confidence_interval = 1
-
-    while abs(mean_ratio) - confidence_interval < 0:
-        mean_ratio, confidence_interval = run_many_trials(
-            trials,
+def get_sample_summary(stats):
+    # Fewer than two finite ratios leave no mean or interval to speak of
+    if stats.count < 2:
+        return (
+            f"undefined ({stats.inf_count} of {stats.count + stats.inf_count} "
+            "ratios infinite)"
+        )
+    return f"{stats.get_mean():.3f} ± {stats.get_ci():.3f}"
+
+
+def sampling_done(stats, target_ci=None, max_trials=None, batch_trials=None):
+    if max_trials is not None and stats.count + stats.inf_count >= max_trials:
+        return True
+    if stats.count < 2:
+        # A whole batch with fewer than two finite ratios: the ratio is
+        # undefined at this point, and sampling on would never end
+        return batch_trials is not None and stats.count + stats.inf_count >= batch_trials
+    if target_ci is not None:
+        return stats.get_ci() <= target_ci
+    # Same decision try_params has always made: stop once the CI clears zero
+    return abs(stats.get_mean()) - stats.get_ci() >= 0
+
+
+@with_executor
+def run_sequential(
+    batch_trials,
+    dip_threshold,
+    dip_window,
+    target_ci=None,
+    max_trials=None,
+    stats=None,
+    vectorized=False,
+    root_seed=None,
+    first_trial=0,
+    instrumentation=NULL_INSTRUMENTATION,
+    executor=None,
+    **trial_kwargs,
+):
+    # Adds batches of trials to one running sample until sampling_done says
+    # stop, instead of starting over with more trials. Pass `stats` to keep
+    # growing a sample from an earlier run, with the root_seed and first_trial
+    # it stopped at so that it carries on with new trials.
+    start = time.perf_counter()
+    stats = stats if stats is not None else RunningStats()
+    root_seed = root_seed if root_seed is not None else new_root_seed()
+    next_trial = first_trial
+    batches = 0
+
+    while not sampling_done(
+        stats, target_ci=target_ci, max_trials=max_trials, batch_trials=batch_trials
+    ):
+        next_trials = batch_trials
+        if target_ci is not None and stats.count > 1:
+            # Size the batch from the current variance estimate, but never
+            # more than doubling the sample in one go
+            needed = math.ceil(stats.get_variance() * (st.norm.ppf(0.95) / target_ci) ** 2)
+            next_trials = min(max(needed - stats.count, batch_trials), stats.count)
+        if max_trials is not None:
+            next_trials = min(next_trials, max_trials - stats.count - stats.inf_count)
+
+        for records in iter_trial_chunks(
+            next_trials,
+            executor,
+            vectorized=vectorized,
+            root_seed=root_seed,
+            first_trial=next_trial,
+            instrumentation=instrumentation,
             dip_threshold=dip_threshold,
             dip_window=dip_window,
-            show_results_table=False,
-            **kwargs,
+            **trial_kwargs,
+        ):
+            with instrumentation.phase("aggregation"):
+                stats.add(net_worth_ratios(records))
+        next_trial += next_trials
+        batches += 1
+
+    return SequentialResult(
+        stats,
+        batches,
+        time.perf_counter() - start,
+        root_seed=root_seed,
+        next_trial=next_trial,
+    )
+
+
+@with_executor
+def try_candidates(
+    trials,
+    candidates,
+    target_ci=None,
+    max_trials=None,
+    root_seed=None,
+    first_trial=0,
+    trial_offsets=None,
+    instrumentation=NULL_INSTRUMENTATION,
+    executor=None,
+    **trial_kwargs,
+):
+    # Sequential sampling over several (dip_threshold, dip_window) points at
+    # once, all on the same paths. Sampling continues until every candidate
+    # meets the stopping rule, and differences against the first candidate
+    # are paired, so they need far fewer trials to resolve. Each batch carries
+    # on from the trial the last one stopped at.
+    #
+    # trial_offsets maps candidates to the next trial not yet used on them;
+    # sampling starts past every candidate's, and leaves them past this
+    # sample, so a candidate seen again is never given the same trials.
+    start = time.perf_counter()
+    root_seed = root_seed if root_seed is not None else new_root_seed()
+    if trial_offsets is not None:
+        first_trial = max(
+            [first_trial, *(trial_offsets.get(c, 0) for c in candidates)]
+        )
+    next_trial = first_trial
+    # Shared paths always go through the vectorized engine, and a paired
+    # sample only means something for this exact set of candidates
+    trial_kwargs.pop("vectorized", None)
+    trial_kwargs.pop("cache", None)
+    stats = [RunningStats() for _ in candidates]
+    differences = [RunningStats() for _ in candidates]
+
+    while not all(
+        sampling_done(
+            s, target_ci=target_ci, max_trials=max_trials, batch_trials=trials
+        )
+        for s in stats
+    ):
+        next_trials = trials
+        if max_trials is not None:
+            next_trials = min(next_trials, max_trials - stats[0].count - stats[0].inf_count)
+        for chunk in iter_candidate_chunks(
+            next_trials,
+            candidates,
+            executor,
+            root_seed=root_seed,
+            first_trial=next_trial,
+            instrumentation=instrumentation,
+            **trial_kwargs,
+        ):
+            with instrumentation.phase("aggregation"):
+                baseline_ratios = net_worth_ratios(chunk[0])
+                for candidate_stats, candidate_differences, records in zip(
+                    stats, differences, chunk
+                ):
+                    ratios = net_worth_ratios(records)
+                    candidate_stats.add(ratios)
+                    candidate_differences.add(ratios - baseline_ratios)
+        next_trial += next_trials
+
+    if trial_offsets is not None:
+        trial_offsets.update((candidate, next_trial) for candidate in candidates)
+
+    elapsed = time.perf_counter() - start
+    for (dip_threshold, dip_window), s, d in zip(candidates, stats, differences):
+        print(
+            f"Threshold {dip_threshold:.3f}, window {dip_window}: "
+            f"{get_sample_summary(s)} "
+            f"({d.get_mean():+.3f} ± {d.get_ci():.3f} paired)"
+        )
+    print(
+        f"{len(candidates)} candidates on {stats[0].count + stats[0].inf_count} "
+        f"shared trials ({elapsed:.1f}s)"
+    )
+
+    return [(s.get_mean(), s.get_ci()) for s in stats]
+
+
+# Trial arguments only the vectorized engine takes
+_VECTORIZED_KWARGS = ("time_block", "path_dtype", "trend_length")
+
+# run_trial arguments that change how a trial is reported but not its outcome
+_REPORTING_KWARGS = (
+    "print_summary",
+    "print_details",
+    "show_chart",
+    "history",
+    "tracer",
+)
+
+
+def evaluation_kwargs(trial_kwargs):
+    # trial_kwargs without the ones that only change reporting or bookkeeping
+    return {
+        key: value
+        for key, value in trial_kwargs.items()
+        if key not in _REPORTING_KWARGS and key != "cache"
+    }
+
+
+def evaluation_params(dip_threshold, dip_window, trial_kwargs):
+    # Everything that determines a point's ratio distribution, with run_trial's
+    # defaults filled in so that equivalent calls share a cache entry
+    params = {
+        name: parameter.default
+        for name, parameter in inspect.signature(run_trial).parameters.items()
+        if parameter.default is not inspect.Parameter.empty
+    }
+    params.update(trial_kwargs)
+    # Strategies only ever keep a whole number of prices in the window
+    params.update(dip_threshold=float(dip_threshold), dip_window=int(dip_window))
+    for key in ("seed", *_REPORTING_KWARGS):
+        params.pop(key, None)
+    # Only set by the sampling method, so keys from before it existed match
+    if params.get("sobol_seed") is None:
+        params.pop("sobol_seed", None)
+    # Without a root seed the trials come from a fresh root, so any sample
+    # can be extended; with one, only samples drawn from that root match
+    root_seed = params.pop("root_seed", None)
+    if root_seed is None:
+        params["seed_policy"] = "random"
+    else:
+        params.update(seed_policy="root", root_seed=root_seed)
+    return params
+
+
+@with_executor
+def try_params(
+    trials,
+    dip_threshold,
+    dip_window,
+    target_ci=None,
+    max_trials=None,
+    cache=None,
+    vectorized=False,
+    default_root_seed=None,
+    trial_offsets=None,
+    instrumentation=NULL_INSTRUMENTATION,
+    executor=None,
+    **kwargs,
+):
+    # trial_offsets works as in try_candidates, for the one point.
+    # default_root_seed draws the trials when neither the caller nor the cache
+    # gives a root, without keying the cache on it
+    stats = None
+    root_seed = kwargs.pop("root_seed", None)
+    candidate = (dip_threshold, dip_window)
+    first_trial = trial_offsets.get(candidate, 0) if trial_offsets is not None else 0
+    if cache is not None:
+        params = evaluation_params(
+            dip_threshold, dip_window, dict(kwargs, root_seed=root_seed)
+        )
+        key = cache.make_key(params)
+        cached = cache.get(key)
+        if cached is not None:
+            # Carry on the cached sample from the trial after its last one
+            stats, cached_root_seed, first_trial = cached
+            if cached_root_seed is not None:
+                root_seed = cached_root_seed
+    if root_seed is None:
+        root_seed = default_root_seed
+
+    result = run_sequential(
+        trials,
+        dip_threshold,
+        dip_window,
+        target_ci=target_ci,
+        max_trials=max_trials,
+        stats=stats,
+        vectorized=vectorized,
+        root_seed=root_seed,
+        first_trial=first_trial,
+        instrumentation=instrumentation,
+        executor=executor,
+        **kwargs,
+    )
+    print(f"Threshold {dip_threshold:.3f}, window {dip_window}: {result}")
+    if trial_offsets is not None:
+        trial_offsets[candidate] = result.next_trial
+
+    if cache is not None:
+        cache.put(
+            key,
+            result.stats,
+            params=params,
+            root_seed=result.root_seed,
+            next_trial=result.next_trial,
         )
-        trials *= 2
 
-    return mean_ratio, confidence_interval
+    return result.mean_ratio, result.confidence_interval
 
 
 def check_ratio(ratio, direction, best_ratio):
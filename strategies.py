@@ -1,13 +1,29 @@
-from collections import deque
 import math
 
-from utilities import cond_print
+from indicators import RollingMean
+from tracing import TRACE_DETAIL, TRACE_TRADES, get_tracer
+
+
+# How much per-turn history a strategy keeps. "full" records everything the
+# charts need, "summary" keeps only the buy turns, and "none" keeps nothing
+# that grows with the number of turns.
+HISTORY_NONE = "none"
+HISTORY_SUMMARY = "summary"
+HISTORY_FULL = "full"
+HISTORY_LEVELS = (HISTORY_NONE, HISTORY_SUMMARY, HISTORY_FULL)
 
 
 class Strategy:
     name = "Base Strategy"
 
-    def __init__(self, seed, starting_money, print_details):
+    def __init__(
+        self, seed, starting_money, print_details, history=HISTORY_FULL, tracer=None
+    ):
+        if history not in HISTORY_LEVELS:
+            raise ValueError(
+                f"Unknown history level {history!r}, expected one of {HISTORY_LEVELS}"
+            )
+        self.history = history
         self.buy_turns = []
         self.shares = 0
         self.peak_price = 0
@@ -15,33 +31,57 @@ class Strategy:
         self.buy_count = 0
         self.peak_count = 0
         self.total_spent = 0
+        # A property of the path, like peak_count, that run_trial fills in
+        # at the end; see vectorized.dca_values
+        self.dca_value = math.nan
 
         self.seed = seed
         self.money = starting_money
         self.print_details = print_details
+        self.tracer = get_tracer(tracer, print_details)
         self.money_history = []
+        self.indicators = []
+
+    def add_indicator(self, indicator):
+        self.indicators.append(indicator)
+        return indicator
 
     def _update_data(self, price):
+        for indicator in self.indicators:
+            indicator.update(price)
         self.last_price = price
         if price > self.peak_price:
             self.peak_price = price
             self.peak_count += 1
-        self.money_history.append(self.money)
+        if self.history == HISTORY_FULL:
+            self.money_history.append(self.money)
 
     def _should_buy(self, _):
         return True
 
+    def _trace_state(self, turn):
+        # Emits whatever per-turn state the strategy decides on
+        pass
+
     def assess_and_buy(self, price, turn):
         self._update_data(price)
+        if self.tracer.level >= TRACE_DETAIL:
+            self._trace_state(turn)
         if self._should_buy(price):
             share_count = math.floor(self.money / price)
             if share_count > 0:
-                cond_print(
-                    self.print_details,
-                    f"{self.name} buying at {price} with {self.money}",
-                )
+                if self.tracer.level >= TRACE_TRADES:
+                    self.tracer.emit(
+                        "buy",
+                        turn,
+                        strategy=self.name,
+                        price=price,
+                        money=self.money,
+                        shares=share_count,
+                    )
                 self.buy_count += 1
-                self.buy_turns.append(turn)
+                if self.history != HISTORY_NONE:
+                    self.buy_turns.append(turn)
             self.money -= price * share_count
             self.total_spent += price * share_count
             self.shares += share_count
@@ -72,24 +112,25 @@ class BuyDipThreshold(Strategy):
 
     def __init__(self, threshold, window, **kwargs) -> None:
         super().__init__(**kwargs)
-        self.prices = deque()
+        self.rolling_mean = self.add_indicator(RollingMean(window))
+        self.prices = self.rolling_mean.values
         self.threshold = threshold
         self.window = window
         self.buy_thresholds = []
 
-    def _update_data(self, price):
-        super()._update_data(price)
-        self.prices.append(price)
-        if len(self.prices) > self.window:
-            self.prices.popleft()
-        cond_print(
-            self.print_details,
-            f"{self.name} 'real value' is {sum(self.prices)/len(self.prices)}",
+    def _trace_state(self, turn):
+        self.tracer.emit(
+            "threshold",
+            turn,
+            strategy=self.name,
+            real_value=self.rolling_mean.value,
+            buy_threshold=self.rolling_mean.value * self.threshold,
         )
 
     def _should_buy(self, price):
-        buy_threshold = sum(self.prices) / len(self.prices) * self.threshold
-        self.buy_thresholds.append(buy_threshold)
+        buy_threshold = self.rolling_mean.value * self.threshold
+        if self.history == HISTORY_FULL:
+            self.buy_thresholds.append(buy_threshold)
         return buy_threshold >= price
 
     def __repr__(self) -> str:
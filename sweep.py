@@ -0,0 +1,175 @@
+import numpy as np
+import prettytable
+
+from aggregation import RunningStats, TDigest
+from executors import with_executor
+from paths import generate_paths
+from simulator import draw_seeds, preload_returns
+from strategies import BuyDipThreshold, BuyRegularly
+from vectorized import (
+    rolling_mean,
+    run_purchases,
+    safe_ratio,
+    salary_schedule,
+    threshold_net_worths,
+)
+
+
+def sweep_chunk(task):
+    # Net worth ratios for one chunk of seeds, shape (windows, thresholds, trials)
+    seeds, dip_thresholds, dip_windows, trial_kwargs = task
+    turns = trial_kwargs["turns"]
+    prices = generate_paths(
+        seeds,
+        turns,
+        starting_price=trial_kwargs["starting_price"],
+        growth_midpoint=trial_kwargs["growth_midpoint"],
+        growth_stddev=trial_kwargs["growth_stddev"],
+        price_model=trial_kwargs["price_model"],
+        returns_source=trial_kwargs["returns_source"],
+        block_length=trial_kwargs["block_length"],
+    )
+    schedule = salary_schedule(
+        turns, trial_kwargs["salary"], trial_kwargs["salary_interval"]
+    )
+    starting_money = trial_kwargs["starting_money"]
+
+    shares, money, _, _ = run_purchases(prices, schedule, starting_money=starting_money)
+    reg_net_worth = shares * prices[:, -1] + money
+
+    return np.stack(
+        [
+            safe_ratio(
+                reg_net_worth,
+                threshold_net_worths(
+                    prices,
+                    schedule,
+                    rolling_mean(prices, dip_window),
+                    dip_thresholds,
+                    starting_money=starting_money,
+                ),
+            )
+            for dip_window in dip_windows
+        ]
+    )
+
+
+class SweepResult:
+    def __init__(self, dip_thresholds, dip_windows, stats, digests):
+        self.dip_thresholds = np.asarray(dip_thresholds, dtype=float)
+        self.dip_windows = np.asarray(dip_windows)
+        self.stats = stats
+        self.digests = digests
+
+    def _grid(self, fn):
+        return np.array(
+            [
+                [fn(i, j) for j in range(len(self.dip_thresholds))]
+                for i in range(len(self.dip_windows))
+            ]
+        )
+
+    @property
+    def trials(self):
+        return self.stats[0][0].count + self.stats[0][0].inf_count
+
+    @property
+    def mean_ratio(self):
+        return self._grid(lambda i, j: self.stats[i][j].get_mean())
+
+    @property
+    def ratio_ci(self):
+        return self._grid(lambda i, j: self.stats[i][j].get_ci())
+
+    @property
+    def median_ratio(self):
+        return self._grid(lambda i, j: self.digests[i][j].get_percentile(50))
+
+    def contour(self, level=1.0):
+        # For each window, the threshold where the mean ratio crosses `level`,
+        # linearly interpolated between neighbouring grid thresholds
+        points = []
+        for dip_window, row in zip(self.dip_windows, self.mean_ratio):
+            above = row >= level
+            for j in np.flatnonzero(above[1:] != above[:-1]):
+                t0, t1 = self.dip_thresholds[j], self.dip_thresholds[j + 1]
+                r0, r1 = row[j], row[j + 1]
+                points.append((dip_window, t0 + (level - r0) * (t1 - t0) / (r1 - r0)))
+        return points
+
+    def print_table(self):
+        table = prettytable.PrettyTable()
+        table.field_names = ["Window \\ Threshold", *self.dip_thresholds]
+        for dip_window, means, cis in zip(
+            self.dip_windows, self.mean_ratio, self.ratio_ci
+        ):
+            table.add_row(
+                [dip_window, *(f"{m:.3f}x ± {ci:.3f}" for m, ci in zip(means, cis))]
+            )
+        table.align = "r"
+        table.vrules = prettytable.FRAME
+        print(table)
+
+
+@with_executor
+def sweep_threshold_window(
+    num_trials,
+    dip_thresholds,
+    dip_windows,
+    turns=365 * 3,
+    starting_price=100,
+    starting_money=0,
+    salary=100,
+    salary_interval=1,
+    growth_midpoint=0.0006,
+    growth_stddev=0.0094,
+    price_model="gbm",
+    returns_source=None,
+    block_length=1,
+    show_table=True,
+    root_seed=None,
+    executor=None,
+):
+    # Response surface of the Reg Buyer vs Dip Buyer ratio over
+    # threshold x window. Each path's rolling mean is computed once per window
+    # and every threshold is evaluated against it in the same pass, so the
+    # cost grows with the number of windows rather than grid cells.
+    trial_kwargs = dict(
+        turns=turns,
+        starting_price=starting_price,
+        starting_money=starting_money,
+        salary=salary,
+        salary_interval=salary_interval,
+        growth_midpoint=growth_midpoint,
+        growth_stddev=growth_stddev,
+        price_model=price_model,
+        returns_source=returns_source,
+        block_length=block_length,
+    )
+    stats = [[RunningStats() for _ in dip_thresholds] for _ in dip_windows]
+    digests = [[TDigest() for _ in dip_thresholds] for _ in dip_windows]
+
+    preload_returns(trial_kwargs)
+    seeds = draw_seeds(num_trials, root_seed=root_seed)
+    for ratios in executor.imap(
+        sweep_chunk,
+        [
+            (chunk, dip_thresholds, dip_windows, trial_kwargs)
+            for chunk in executor.chunks(seeds, max_chunk_size=250)
+        ],
+    ):
+        for i in range(len(dip_windows)):
+            for j in range(len(dip_thresholds)):
+                stats[i][j].add(ratios[i, j])
+                digests[i][j].add(ratios[i, j])
+
+    result = SweepResult(dip_thresholds, dip_windows, stats, digests)
+    if show_table:
+        print(
+            f"{BuyRegularly.name} vs {BuyDipThreshold.name}: mean net worth ratio "
+            f"(95% CI) over {result.trials} trials"
+        )
+        result.print_table()
+        for dip_window, dip_threshold in result.contour():
+            print(f"Ratio crosses 1 at window {dip_window}, threshold {dip_threshold:.4f}")
+    return result
@@ -0,0 +1,85 @@
+from collections import deque
+import json
+
+
+# How much a trial traces. Call sites compare the tracer's level against
+# these before building an event, so a disabled tracer costs one comparison
+# per turn and no formatting at all.
+TRACE_OFF = 0
+TRACE_TRADES = 1  # Buys
+TRACE_DETAIL = 2  # Buys, every price update and the dip buyer's threshold
+
+
+class RingBuffer:
+    # Keeps the last `capacity` events in memory
+    def __init__(self, capacity=100000):
+        self.events = deque(maxlen=capacity)
+
+    def write(self, event):
+        self.events.append(event)
+
+    def get_events(self, kind=None):
+        if kind is None:
+            return list(self.events)
+        return [event for event in self.events if event["kind"] == kind]
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    # Writes one JSON object per event to `filename`
+    def __init__(self, filename):
+        self.file = open(filename, "w")
+
+    def write(self, event):
+        self.file.write(json.dumps(event))
+        self.file.write("\n")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class PrintSink:
+    # The messages print_details has always printed
+    formats = {
+        "price": "Price changed by {change}. New price is {price}",
+        "buy": "{strategy} buying at {price} with {money}",
+        "threshold": "{strategy} 'real value' is {real_value}",
+    }
+
+    def write(self, event):
+        print(self.formats[event["kind"]].format(**event))
+
+    def close(self):
+        pass
+
+
+class Tracer:
+    def __init__(self, sink, level=TRACE_DETAIL):
+        self.sink = sink
+        self.level = level
+
+    def emit(self, kind, turn, **fields):
+        self.sink.write({"kind": kind, "turn": turn, **fields})
+
+    def __repr__(self) -> str:
+        return f"Tracer({type(self.sink).__name__}, level={self.level})"
+
+
+NULL_TRACER = Tracer(None, level=TRACE_OFF)
+
+
+def get_tracer(tracer=None, print_details=False):
+    # An explicit tracer wins; print_details alone prints every event
+    if tracer is not None:
+        return tracer
+    if print_details:
+        return Tracer(PrintSink())
+    return NULL_TRACER
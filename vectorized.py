@@ -0,0 +1,378 @@
+import numpy as np
+
+from strategies import BuyDipThreshold, BuyDipTrend, BuyRegularly, NeverBuy
+
+
+class BatchResult:
+    # Array counterpart of a list of Strategy objects: one entry per trial.
+
+    def __init__(
+        self,
+        name,
+        seeds,
+        shares,
+        money,
+        total_spent,
+        buy_count,
+        peak_count,
+        last_price,
+        dca_value=None,
+    ):
+        self.name = name
+        self.seed = np.asarray(seeds, dtype=np.int64)
+        self.shares = np.asarray(shares, dtype=np.int64)
+        self.money = np.asarray(money, dtype=float)
+        self.total_spent = np.asarray(total_spent, dtype=float)
+        self.buy_count = np.asarray(buy_count, dtype=np.int64)
+        self.peak_count = np.asarray(peak_count, dtype=np.int64)
+        self.last_price = np.asarray(last_price, dtype=float)
+        # A property of the path, like peak_count; see dca_values
+        self.dca_value = (
+            np.full(len(self.seed), np.nan)
+            if dca_value is None
+            else np.asarray(dca_value, dtype=float)
+        )
+
+    @classmethod
+    def from_strategies(cls, strategies):
+        return cls(
+            strategies[0].name,
+            [s.seed for s in strategies],
+            [s.shares for s in strategies],
+            [s.money for s in strategies],
+            [s.total_spent for s in strategies],
+            [s.buy_count for s in strategies],
+            [s.peak_count for s in strategies],
+            [s.last_price for s in strategies],
+            [s.dca_value for s in strategies],
+        )
+
+    def get_net_worth(self):
+        return self.shares * self.last_price + self.money
+
+    def get_avg_price(self):
+        return safe_ratio(self.total_spent, self.shares, empty=0)
+
+    def __len__(self):
+        return len(self.seed)
+
+    def __repr__(self) -> str:
+        return f"{self.name}: {len(self)} trials"
+
+
+def safe_ratio(numerator, denominator, empty=np.inf):
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    out = np.full(np.broadcast(numerator, denominator).shape, empty, dtype=float)
+    return np.divide(numerator, denominator, out=out, where=denominator > 0)
+
+
+def salary_schedule(turns, salary=100, salary_interval=1):
+    schedule = np.zeros(turns)
+    schedule[::salary_interval] = salary
+    return schedule
+
+
+def dca_values(prices, schedule):
+    # What every salary would be worth at the end had it all bought fractional
+    # shares on the day it was paid, as a multiple of the salary paid in. Its
+    # expectation is known exactly for GBM paths, which makes it a control
+    # variate for the strategies' net worths.
+    return (schedule / prices).sum(axis=1) * prices[:, -1] / schedule.sum()
+
+
+def peak_counts(prices):
+    # A turn counts as a peak when it beats every earlier price (the first
+    # price always does, since Strategy.peak_price starts at 0).
+    previous_peak = np.zeros_like(prices)
+    previous_peak[:, 1:] = np.maximum.accumulate(prices, axis=1)[:, :-1]
+    return np.count_nonzero(prices > previous_peak, axis=1)
+
+
+def rolling_mean(prices, window):
+    # Mean of the last `window` prices including the current one, or of all
+    # prices so far while fewer than `window` have been seen. optimal_walker
+    # can hand over integral floats, which BuyDipThreshold accepts too.
+    window = int(window)
+    sums = np.cumsum(prices, axis=1)
+    sums[:, window:] -= sums[:, :-window].copy()
+    counts = np.minimum(np.arange(1, prices.shape[1] + 1), window)
+    return sums / counts
+
+
+def dip_threshold_mask(prices, threshold, window):
+    return rolling_mean(prices, window) * threshold >= prices
+
+
+def dip_trend_mask(prices, trend_length):
+    turns = np.arange(prices.shape[1])
+    down = np.zeros(prices.shape, dtype=bool)
+    down[:, 1:] = prices[:, 1:] < prices[:, :-1]
+    last_reset = np.maximum.accumulate(np.where(down, 0, turns), axis=1)
+    return turns - last_reset >= trend_length
+
+
+class Holdings:
+    # One strategy's money and shares in every trial, carried from one block
+    # of turns to the next
+
+    def __init__(self, trials, starting_money=0):
+        self.money = np.full(trials, float(starting_money))
+        self.shares = np.zeros(trials)
+        self.total_spent = np.zeros(trials)
+        self.buy_count = np.zeros(trials, dtype=np.int64)
+
+    def run_purchases(self, prices, schedule, buy_mask=None, net_worths=None):
+        # Mirrors Strategy.assess_and_buy: every turn that the mask allows,
+        # spend as much money as possible on whole shares. Trials are
+        # independent, so the only Python loop is over turns. A
+        # (turns, trials) `net_worths` array is filled with every turn's
+        # closing net worth.
+        if buy_mask is not None and not buy_mask.any():
+            if net_worths is not None:
+                net_worths[:] = self.money + np.cumsum(schedule)[:, None]
+            self.money += schedule.sum()
+            return
+
+        # Turn-major copies keep each per-turn slice contiguous
+        prices_t = np.ascontiguousarray(prices.T)
+        mask_t = None if buy_mask is None else np.ascontiguousarray(buy_mask.T)
+
+        money = self.money
+        shares = self.shares
+        for turn, price in enumerate(prices_t):
+            if schedule[turn]:
+                money += schedule[turn]
+            share_count = np.floor(money / price)
+            if mask_t is not None:
+                share_count *= mask_t[turn]
+            self.buy_count += share_count > 0
+            spent = price * share_count
+            money -= spent
+            self.total_spent += spent
+            shares += share_count
+            if net_worths is not None:
+                np.multiply(shares, price, out=net_worths[turn])
+                net_worths[turn] += money
+
+
+def run_purchases(prices, schedule, starting_money=0, buy_mask=None, net_worths=None):
+    holdings = Holdings(prices.shape[0], starting_money=starting_money)
+    holdings.run_purchases(prices, schedule, buy_mask=buy_mask, net_worths=net_worths)
+    return holdings.shares, holdings.money, holdings.total_spent, holdings.buy_count
+
+
+def evaluate_masks(prices, schedule, seeds, masks, starting_money=0):
+    peaks = peak_counts(prices)
+    last_price = prices[:, -1]
+    dca = dca_values(prices, schedule)
+
+    results = {}
+    for name, mask in masks.items():
+        shares, money, total_spent, buy_count = run_purchases(
+            prices, schedule, starting_money=starting_money, buy_mask=mask
+        )
+        results[name] = BatchResult(
+            name,
+            seeds,
+            shares,
+            money,
+            total_spent,
+            buy_count,
+            peaks,
+            last_price,
+            dca_value=dca,
+        )
+    return results
+
+
+def evaluate_strategies(
+    prices,
+    schedule,
+    seeds,
+    starting_money=0,
+    dip_threshold=0.95,
+    dip_window=30,
+    trend_length=None,
+):
+    masks = {
+        BuyRegularly.name: None,
+        BuyDipThreshold.name: dip_threshold_mask(prices, dip_threshold, dip_window),
+        NeverBuy.name: np.zeros(prices.shape, dtype=bool),
+    }
+    if trend_length is not None:
+        masks[BuyDipTrend.name] = dip_trend_mask(prices, trend_length)
+    return evaluate_masks(prices, schedule, seeds, masks, starting_money=starting_money)
+
+
+class StreamingEvaluation:
+    # evaluate_strategies for paths that arrive a block of turns at a time
+    # (see paths.iter_path_blocks). Everything a strategy decides on carries
+    # over between blocks: each trial's last and peak price, the dip buyer's
+    # last dip_window - 1 prices so its rolling mean continues, the trend
+    # buyer's run of falling turns, and every strategy's Holdings. Memory is
+    # trials x (block + dip_window) however many turns there are.
+
+    def __init__(
+        self,
+        trials,
+        starting_money=0,
+        salary=100,
+        salary_interval=1,
+        dip_threshold=0.95,
+        dip_window=30,
+        trend_length=None,
+    ):
+        self.turn = 0
+        self.salary = salary
+        self.salary_interval = salary_interval
+        self.dip_threshold = dip_threshold
+        self.dip_window = int(dip_window)
+        self.trend_length = trend_length
+        self.last_price = np.zeros(trials)
+        self.peak_price = np.zeros(trials)
+        self.peak_count = np.zeros(trials, dtype=np.int64)
+        self.trend_count = np.zeros(trials, dtype=np.int64)
+        self.window_prices = None
+        self.salary_over_price = np.zeros(trials)
+        self.salary_paid = 0.0
+
+        names = [BuyRegularly.name, BuyDipThreshold.name, NeverBuy.name]
+        if trend_length is not None:
+            names.append(BuyDipTrend.name)
+        self.holdings = {name: Holdings(trials, starting_money) for name in names}
+
+    def _dip_mask(self, prices, turns):
+        # rolling_mean, continued from the prices kept from earlier blocks
+        if self.window_prices is None:
+            self.window_prices = prices[:, :0]
+        carried = self.window_prices.shape[1]
+        extended = np.concatenate([self.window_prices, prices], axis=1)
+        sums = np.cumsum(extended, axis=1, dtype=np.float64)
+        # Index in `sums` just before each turn's window starts
+        before = np.arange(carried, extended.shape[1]) - self.dip_window
+        rolling = sums[:, carried:]
+        rolling[:, before >= 0] -= sums[:, before[before >= 0]]
+        means = rolling / np.minimum(turns + 1, self.dip_window)
+        keep = max(extended.shape[1] - self.dip_window + 1, 0)
+        self.window_prices = extended[:, keep:].copy()
+        return means * self.dip_threshold >= prices
+
+    def _trend_mask(self, prices):
+        # dip_trend_mask, with a run of falling turns able to span blocks
+        previous = np.concatenate([self.last_price[:, None], prices[:, :-1]], axis=1)
+        turns = np.arange(prices.shape[1])
+        last_reset = np.maximum.accumulate(np.where(prices < previous, -1, turns), axis=1)
+        trend = np.where(
+            last_reset >= 0, turns - last_reset, self.trend_count[:, None] + turns + 1
+        )
+        self.trend_count = trend[:, -1]
+        return trend >= self.trend_length
+
+    def add(self, prices):
+        count = prices.shape[1]
+        turns = np.arange(self.turn, self.turn + count)
+        schedule = np.where(turns % self.salary_interval == 0, float(self.salary), 0)
+
+        running_peak = np.maximum.accumulate(prices, axis=1)
+        previous_peak = np.empty(prices.shape)
+        previous_peak[:, 0] = self.peak_price
+        np.maximum(running_peak[:, :-1], self.peak_price[:, None], out=previous_peak[:, 1:])
+        self.peak_count += np.count_nonzero(prices > previous_peak, axis=1)
+        self.peak_price = np.maximum(self.peak_price, running_peak[:, -1])
+        self.salary_over_price += (schedule / prices).sum(axis=1)
+        self.salary_paid += schedule.sum()
+
+        masks = {
+            BuyRegularly.name: None,
+            BuyDipThreshold.name: self._dip_mask(prices, turns),
+            NeverBuy.name: np.zeros(prices.shape, dtype=bool),
+        }
+        if self.trend_length is not None:
+            masks[BuyDipTrend.name] = self._trend_mask(prices)
+        for name, mask in masks.items():
+            self.holdings[name].run_purchases(prices, schedule, buy_mask=mask)
+
+        self.last_price = prices[:, -1].astype(np.float64)
+        self.turn += count
+
+    def get_results(self, seeds):
+        dca = self.salary_over_price * self.last_price / self.salary_paid
+        return {
+            name: BatchResult(
+                name,
+                seeds,
+                holdings.shares,
+                holdings.money,
+                holdings.total_spent,
+                holdings.buy_count,
+                self.peak_count,
+                self.last_price,
+                dca_value=dca,
+            )
+            for name, holdings in self.holdings.items()
+        }
+
+
+def evaluate_candidates(prices, schedule, seeds, candidates, starting_money=0):
+    # Evaluates several (dip_threshold, dip_window) points on the same paths.
+    # Only the dip buyer depends on them, so the other strategies are computed
+    # once, and so is the rolling mean for each distinct window.
+    shared = evaluate_masks(
+        prices,
+        schedule,
+        seeds,
+        {BuyRegularly.name: None, NeverBuy.name: np.zeros(prices.shape, dtype=bool)},
+        starting_money=starting_money,
+    )
+    means = {}
+    results = []
+    for dip_threshold, dip_window in candidates:
+        window = int(dip_window)
+        if window not in means:
+            means[window] = rolling_mean(prices, window)
+        results.append(
+            {
+                **shared,
+                **evaluate_masks(
+                    prices,
+                    schedule,
+                    seeds,
+                    {BuyDipThreshold.name: means[window] * dip_threshold >= prices},
+                    starting_money=starting_money,
+                ),
+            }
+        )
+    return results
+
+
+def evaluate_thresholds(
+    prices, schedule, seeds, dip_thresholds, starting_money=0, dip_window=30
+):
+    return evaluate_candidates(
+        prices,
+        schedule,
+        seeds,
+        [(dip_threshold, dip_window) for dip_threshold in dip_thresholds],
+        starting_money=starting_money,
+    )
+
+
+def threshold_net_worths(prices, schedule, means, dip_thresholds, starting_money=0):
+    # Final dip buyer net worth for every threshold at once, shape
+    # (thresholds, trials). The buy mask is built one turn at a time from the
+    # precomputed rolling mean, so memory stays at thresholds x trials.
+    thresholds = np.asarray(dip_thresholds, dtype=float)[:, None]
+    prices_t = np.ascontiguousarray(prices.T)
+    means_t = np.ascontiguousarray(means.T)
+
+    money = np.full((len(thresholds), prices.shape[0]), float(starting_money))
+    shares = np.zeros_like(money)
+    for turn, price in enumerate(prices_t):
+        if schedule[turn]:
+            money += schedule[turn]
+        share_count = np.floor(money / price) * (means_t[turn] * thresholds >= price)
+        money -= price * share_count
+        shares += share_count
+
+    return shares * prices[:, -1] + money